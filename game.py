@@ -1,13 +1,20 @@
 from sys import argv
 import os
 from time import time
-from random import choice, randrange
+from random import Random, seed as seed_random
 from bisect import bisect
+from collections import deque
+from cStringIO import StringIO
 
 d = os.path.dirname(argv[0])
 if d: # else current dir
     os.chdir(d)
 
+if len(argv) >= 2 and argv[1] in ('headless', 'bench', 'replay'):
+    # no window or sound output
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
 import pygame as pg
 from pygame.time import wait
 if os.name == 'nt':
@@ -19,7 +26,17 @@ pg.init()
 
 from game.conf import conf
 from game.level import level_backends
-from game.util import ir, convert_sfc
+from game.util import (ir, convert_sfc, merge_rects, display_depth,
+                       in_thread)
+from game.cache import Cache
+from game import atlas
+from game.preload import Preloader
+from game.diskcache import DiskCache
+from game.sound import SoundBank
+from game.frametime import FrameTimer
+from game.governor import Governor
+from game.latency import LatencyTracker
+from game import replay
 from game.ext.sched import Scheduler
 from game.ext import evthandler as eh
 if conf.USE_FONTS:
@@ -51,9 +68,13 @@ create_backend
 start_backend
 get_backends
 quit_backend
+set_input
 img
+preload
 render_text
 clear_caches
+unpin_caches
+cache_stats
 play_snd
 find_music
 play_music
@@ -68,6 +89,8 @@ linear_fade
 refresh_display
 toggle_fullscreen
 minimise
+toggle_hud
+dump_frame_times
 
     ATTRIBUTES
 
@@ -79,11 +102,46 @@ backends: a list of previous (nested) backends, most 'recent' last.  Each is
           object itself.)
 overlay: the current overlay (see Game.set_overlay).
 fading: whether a fade is in progress (see Game.fade)
-file_cache, img_cache, text_cache: caches for loaded image cache (before
-                                   resize), images and rendered text
-                                   respectively.
+governor: a governor.Governor instance that chooses the current backend's draw
+          rate from conf.DRAW_FPS_TIERS, or None if there are no tiers for the
+          backend (then conf.DRAW_FPS is used).  Its tier and history may be
+          inspected; it only adapts when frames are throttled.  It's given the
+          time for each draw plus one update, since a draw can cover several
+          updates at lower rates or when catching up.
+drawing: whether to draw backends and update the display; if False, backends
+         are only updated.
+frame: the number of frames drawn so far (or run, if not drawing).  Backends
+       are updated at a fixed rate (conf.FPS) and drawn in between as often as
+       conf.DRAW_FPS allows, so several updates may run per draw when behind.
+       This goes up when frame_timer starts timing a frame, so it identifies
+       the frame being timed.
+interp: the fraction of an update that had passed when the current draw
+        started, 0 <= interp <= 1; backends may use this to interpolate
+        movement between updates.
+frame_timer: a frametime.FrameTimer instance that records the time taken by
+             each phase of every frame: 'events', 'update', 'fade',
+             'timeouts' (other scheduled callbacks), 'draw', 'overlay' and
+             'present'.
+presented: the number of pixels updated on the display in the last frame.
+latency: a latency.LatencyTracker instance that measures the time from clicks
+         to the first presented frame that shows the frog's response, by
+         action ('move', 'inspect', 'grab', 'drop', 'use', or 'fail' if the
+         frog just says it can't).
+hud: whether the frame timing HUD is shown (see Game.toggle_hud).
+file_cache, img_cache, text_cache: cache.Cache instances for loaded images
+                                   (before resize), images and rendered text
+                                   respectively, with memory budgets from
+                                   conf.CACHE_BUDGETS.
+caches: a {name: cache} dict of the above caches, with names 'file', 'image'
+        and 'text' respectively.
+preloader: a preload.Preloader instance used by Game.preload.
+disk_cache: a diskcache.DiskCache instance that Game.img stores decoded and
+            scaled images in, or None if conf.USE_IMG_DISK_CACHE is False.
+sounds: a sound.SoundBank instance used by Game.play_snd.
 fonts: a fonthandler.Fonts instance, or None if conf.USE_FONTS is False.
-music: filenames for known music.
+music: filenames for known music (empty until Game.find_music finishes).
+input: the object backends' event handlers get events from (see
+       Game.set_input), or None.
 
 """
 
@@ -92,29 +150,67 @@ music: filenames for known music.
         'backend': None,
         'overlay': False,
         'fading': False,
-        '_fade_data': None
+        '_fade_data': None,
+        'governor': None
     }
 
     def __init__ (self, *args, **kwargs):
         self.scheduler = Scheduler()
         self.scheduler.add_timeout(self._update, frames = 1, repeat_frames = 1)
+        self.scheduler.draw = self._draw
+        self.scheduler.after_frame = self._end_update
+        self.scheduler.timer.max_frames = conf.MAX_CATCH_UP_FRAMES
+        self.scheduler.timer.spin = conf.TIMER_SPIN
+        self.scheduler.profile = conf.PROFILE_CALLBACKS
+        self.scheduler.slow_share = conf.CALLBACK_SLOW_SHARE
+        self.drawing = True
+        self.presented = 0
+        self.latency = LatencyTracker(conf.LATENCY_SIZE)
+        self.frame = 0
+        self.interp = 1
+        self._timing = False
+        # updates run in the frame being timed
+        self._updates = 0
+        self.frame_timer = FrameTimer(('events', 'update', 'fade', 'timeouts',
+                                       'draw', 'overlay', 'present'),
+                                      conf.FRAME_TIMES_SIZE)
+        self.hud = False
+        self._hud_sfc = None
         # initialise caches
-        self.file_cache = {}
-        self.img_cache = {}
-        self.text_cache = {}
+        budgets = conf.CACHE_BUDGETS
+        self.file_cache = Cache(budgets['file'])
+        self.img_cache = Cache(budgets['image'])
+        self.text_cache = Cache(budgets['text'])
+        self.caches = {'file': self.file_cache, 'image': self.img_cache,
+                       'text': self.text_cache}
+        # {directory: {filename: surface}}, or None for no atlas
+        self._atlases = {}
+        self._atlas_pages = []
+        self.preloader = Preloader()
+        # images found in the disk cache by Game.preload, to load in the
+        # preload task instead of decoding
+        self._preload_disk = deque()
+        self._preload_task = None
+        self.input = None
+        # separate from the game's random numbers (see sound.SoundBank)
+        self._music_random = Random()
+        self.music = []
+        # whether to pause music once it's loaded
+        self._pause_music = not conf.MUSIC_AUTOPLAY
+        if conf.USE_IMG_DISK_CACHE:
+            self.disk_cache = DiskCache(conf.IMG_DISK_CACHE_DIR)
+        else:
+            self.disk_cache = None
         # load display settings
         self.refresh_display()
         self.fonts = Fonts(conf.FONT_DIR) if conf.USE_FONTS else None
+        self.sounds = SoundBank()
         # start first backend
         self.backends = []
-        self._last_overlay = False
         self.start_backend(*args, **kwargs)
-        # start playing music
+        # start playing music once it's found
         pg.mixer.music.set_endevent(conf.EVENT_ENDMUSIC)
         self.find_music()
-        self.play_music()
-        if not conf.MUSIC_AUTOPLAY:
-            pg.mixer.music.pause()
 
     def _init_backend (self):
         """Set some default attributes for a new backend."""
@@ -138,9 +234,21 @@ music: filenames for known music.
         self._update_again = True
         self.backend = backend
         backend.dirty = True
+        # the handler may have missed key events while another was active
+        backend.event_handler.resync()
+        # only queue events this backend handles
+        backend.event_handler.filter_events()
         i = get_backend_id(backend)
         # set some per-backend things
         self.scheduler.timer.set_fps(conf.FPS[i])
+        if self.governor is None and conf.DRAW_FPS_TIERS[i]:
+            self.governor = Governor(conf.DRAW_FPS_TIERS[i],
+                                     conf.GOVERNOR_WINDOW, conf.GOVERNOR_MISS,
+                                     conf.GOVERNOR_HEADROOM)
+        if self.governor is None:
+            self.scheduler.timer.set_draw_fps(conf.DRAW_FPS[i])
+        else:
+            self.scheduler.timer.set_draw_fps(self.governor.fps)
         if conf.USE_FONTS:
             fonts = self.fonts
             for k, v in conf.REQUIRED_FONTS[i].iteritems():
@@ -194,8 +302,10 @@ backend should use for input, and is stored in its event_handler attribute.
             conf.EVENT_ENDMUSIC: self.play_music
         }, [
             (conf.KEYS_FULLSCREEN, self.toggle_fullscreen, eh.MODE_ONDOWN),
-            (conf.KEYS_MINIMISE, self.minimise, eh.MODE_ONDOWN)
-        ], False, self.quit)
+            (conf.KEYS_MINIMISE, self.minimise, eh.MODE_ONDOWN),
+            (conf.KEYS_HUD, self.toggle_hud, eh.MODE_ONDOWN)
+        ], False, self.quit, coalesce = {pg.MOUSEMOTION: eh.coalesce_motion})
+        self._set_handler_input(event_handler)
         # instantiate class
         backend = cls(self, event_handler, *args)
         backend.event_handler = event_handler
@@ -259,16 +369,47 @@ If the running backend is the last (root) one, exit the game.
             self.quit()
         self.quit_backend(depth - 1)
 
-    def img (self, filename, size = None, cache = True):
+    def set_input (self, source):
+        """Set where backends get input events from.
+
+set_input(source)
+
+source: an object with methods get, get_pressed and get_mods, as taken by
+        evthandler.EventHandler for event_source, key_source and mod_source,
+        such as a replay.Recorder or replay.Player, or None to use the keyboard
+        and pygame.event.get.
+
+This applies to running backends and any created later.
+
+"""
+        self.input = source
+        for data in self.backends + [{'backend': self.backend}]:
+            self._set_handler_input(data['backend'].event_handler)
+
+    def _set_handler_input (self, event_handler):
+        """Make an event handler take input from Game.input."""
+        source = self.input
+        if source is None:
+            event_handler.event_source = pg.event.get
+            event_handler.key_source = eh.pressed_keys
+            event_handler.mod_source = pg.key.get_mods
+        else:
+            event_handler.event_source = source.get
+            event_handler.key_source = source.get_pressed
+            event_handler.mod_source = source.get_mods
+
+    def img (self, filename, size = None, cache = True, pin = False):
         """Load or scale an image, or retrieve it from cache.
 
-img(filename[, size], cache = True) -> surface
+img(filename[, size], cache = True, pin = False) -> surface
 
 filename: a filename to load.  Can be a tuple of path sections to join.
 size: scale the image.  Can be an (x, y) size, a rect (in which case its
       dimension is used), or a number to scale by.  If (x, y), either x or y
       can be None to scale to the other with aspect ratio preserved.
 cache: whether to store this image in the cache if not already stored.
+pin: whether to stop this image from being evicted from the cache (see
+     Game.unpin_caches).  This implies cache = True.
 
 """
         # get standardised cache key
@@ -280,24 +421,49 @@ cache: whether to store this image in the cache if not already stored.
                     # rect
                     size = size[2:]
                 size = tuple(size)
-        # standardise path
-        if not isinstance(filename, basestring):
-            filename = os.path.join(*filename)
-        filename = os.path.normpath(filename)
+        filename = self._norm_img_filename(filename)
         key = (filename, size)
-        if key in self.img_cache:
+        rescale = size is not None and size != 1
+        if pin:
+            cache = True
+            if rescale:
+                self.img_cache.pin(key)
+            else:
+                self.file_cache.pin(conf.IMG_DIR + filename)
+        # unscaled images are only stored in the file cache
+        if rescale and key in self.img_cache:
             return self.img_cache[key]
         # else new: load/render
+        rel_filename = filename
         filename = conf.IMG_DIR + filename
+        disk = self.disk_cache
+        if rescale and disk is not None:
+            img = disk.get(filename, size)
+            if img is not None:
+                img = convert_sfc(img)
+                if cache:
+                    self.img_cache[key] = img
+                return img
         # also cache loaded images to reduce file I/O
         if filename in self.file_cache:
             img = self.file_cache[filename]
         else:
-            img = convert_sfc(pg.image.load(filename))
+            img = self._atlas_img(rel_filename)
+            if img is None:
+                if disk is not None:
+                    img = disk.get(filename, None)
+                if img is None:
+                    img = self.preloader.take(filename)
+                    if img is None:
+                        img = pg.image.load(filename)
+                    if disk is not None:
+                        disk.put(filename, None, img)
+                img = convert_sfc(img)
             if cache:
                 self.file_cache[filename] = img
         # scale
-        if size is not None and size != 1:
+        if rescale:
+            disk_key = size
             current_size = img.get_size()
             if not isinstance(size, tuple):
                 size = (ir(size * current_size[0]), ir(size * current_size[1]))
@@ -308,6 +474,8 @@ cache: whether to store this image in the cache if not already stored.
                     scale = float(size[not i]) / current_size[not i]
                     size[i] = ir(current_size[i] * scale)
             img = pg.transform.smoothscale(img, size)
+            if disk is not None:
+                disk.put(filename, disk_key, img)
             # speed up blitting (if not resized, this is already done)
             img = convert_sfc(img)
             if cache:
@@ -315,6 +483,102 @@ cache: whether to store this image in the cache if not already stored.
                 self.img_cache[key] = img
         return img
 
+    def _norm_img_filename (self, filename):
+        """Standardise an image filename as taken by Game.img."""
+        if not isinstance(filename, basestring):
+            filename = os.path.join(*filename)
+        return os.path.normpath(filename)
+
+    def preload (self, filenames):
+        """Start decoding images in the background.
+
+Takes a list of filenames as taken by Game.img.  Images are decoded on a worker
+thread, then converted for display and stored in the file cache a few at a time
+in the time left over between frames (a scheduler task).  Images that are
+already cached or are in an atlas are skipped, and those in the disk cache are
+loaded from there by the task instead of being decoded.
+
+"""
+        disk = self.disk_cache
+        todo = []
+        for fn in filenames:
+            fn = self._norm_img_filename(fn)
+            if self.file_cache.has(conf.IMG_DIR + fn) or \
+               self._atlas_img(fn) is not None:
+                continue
+            fn = conf.IMG_DIR + fn
+            if disk is not None and disk.has(fn, None):
+                self._preload_disk.append(fn)
+            else:
+                todo.append(fn)
+        self.preloader.add(*todo)
+        if (todo or self._preload_disk) and self._preload_task is None:
+            self._preload_task = \
+                self.scheduler.add_task(self._convert_preloaded())
+
+    def _convert_preloaded (self):
+        """Task to move preloaded images into the file cache.
+
+Converts one image per step, from the preloader or the disk cache, and finishes
+when nothing is left to load or decode.  Decoded images are written to the disk
+cache.
+
+"""
+        preloader = self.preloader
+        from_disk = self._preload_disk
+        disk = self.disk_cache
+        cache = self.file_cache
+        while True:
+            done = False
+            for fn, img in preloader.ready(1):
+                if not cache.has(fn):
+                    cache[fn] = img = convert_sfc(img)
+                    if disk is not None:
+                        disk.put(fn, None, img)
+                done = True
+            if not done and from_disk:
+                fn = from_disk.popleft()
+                if not cache.has(fn):
+                    img = disk.get(fn, None)
+                    if img is None:
+                        # removed or changed since it was checked
+                        preloader.add(fn)
+                    else:
+                        cache[fn] = convert_sfc(img)
+                done = True
+            if not done and not preloader.pending():
+                break
+            yield done
+        self._preload_task = None
+
+    def _atlas_img (self, filename):
+        """Get an image from its directory's atlas, if possible.
+
+Takes a normalised filename relative to conf.IMG_DIR, and returns a subsurface
+of an atlas page, or None if the image isn't in an atlas.
+
+"""
+        if not conf.USE_ATLASES:
+            return None
+        d, fn = os.path.split(filename)
+        if d not in conf.ATLAS_DIRS:
+            return None
+        if d not in self._atlases:
+            data = atlas.load(d)
+            if data is not None:
+                pages, imgs = data
+                # pages hold the pixels for all subsurfaces, so account for
+                # them in the cache and keep them for the whole session
+                for i, page in enumerate(pages):
+                    key = (d, i)
+                    self._atlas_pages.append(key)
+                    self.file_cache.pin(key)
+                    self.file_cache[key] = page
+                data = imgs
+            self._atlases[d] = data
+        imgs = self._atlases[d]
+        return None if imgs is None else imgs.get(fn)
+
     def render_text (self, *args, **kwargs):
         """Render text and cache the result.
 
@@ -354,12 +618,36 @@ Returns the same value as fonthandler.Fonts
     """
         if not caches:
             caches = ('file', 'image', 'text')
+        for c in caches:
+            self.caches[c].clear()
         if 'file' in caches:
-            self.file_cache = {}
-        if 'image' in caches:
-            self.img_cache = {}
-        if 'text' in caches:
-            self.text_cache = {}
+            # atlas pages were stored in the file cache
+            self._atlases = {}
+            self._atlas_pages = []
+
+    def unpin_caches (self, *caches):
+        """Allow all cached items to be evicted.
+
+Takes the same arguments as Game.clear_caches.  Unlike clearing, this doesn't
+drop anything immediately: unused items are dropped gradually as new ones are
+cached.
+
+"""
+        if not caches:
+            caches = ('file', 'image', 'text')
+        for c in caches:
+            self.caches[c].unpin_all()
+        # atlases are kept for the whole session
+        self.file_cache.pin(*self._atlas_pages)
+
+    def cache_stats (self):
+        """Get statistics for each cache.
+
+Returns a {name: stats} dict, with names as taken by Game.clear_caches, and
+stats as returned by cache.Cache.stats.
+
+"""
+        return dict((c, cache.stats()) for c, cache in self.caches.iteritems())
 
     def play_snd (self, base_ID, volume = 1):
         """Play a sound.
@@ -371,50 +659,75 @@ base_ID: the ID of the sound to play (we look for base_ID + i for a number i,
 volume: float to scale volume by.
 
 """
-        ID = randrange(conf.SOUNDS[base_ID])
-        # load sound
-        snd = conf.SOUND_DIR + base_ID + str(ID) + '.ogg'
-        snd = pg.mixer.Sound(snd)
-        if snd.get_length() < 10 ** -3:
-            # no way this is valid
-            return
         volume *= conf.SOUND_VOLUME * conf.SOUND_VOLUMES[base_ID]
-        snd.set_volume(volume)
-        snd.play()
+        self.sounds.play(base_ID, volume)
 
     def find_music (self):
-        """Store a list of music files."""
-        d = conf.MUSIC_DIR
-        try:
-            files = os.listdir(d)
-        except OSError:
-            # no directory
-            self.music = []
-        else:
-            self.music = [d + f for f in files if os.path.isfile(d + f)]
+        """Look for music files in the background.
+
+The directory is listed on another thread, in a scheduler task.  When it's
+done, the files found are stored in Game.music, and Game.play_music is called
+if no music is playing.
+
+"""
+        self.scheduler.add_task(in_thread(_list_music, (conf.MUSIC_DIR,),
+                                          self._found_music))
+
+    def _found_music (self, music):
+        self.music = music
+        if not pg.mixer.music.get_busy():
+            self.play_music()
 
     def play_music (self, event = None):
-        """Play next piece of music."""
+        """Play next piece of music.
+
+The file is read on another thread, in a scheduler task, and starts playing
+once it's loaded.
+
+"""
         if self.music:
-            f = choice(self.music)
-            pg.mixer.music.load(f)
-            pg.mixer.music.play()
+            f = self._music_random.choice(self.music)
+            self.scheduler.add_task(in_thread(_read_file, (f,),
+                                              self._load_music))
         else:
             # stop currently playing music if there's no music to play
             pg.mixer.music.stop()
 
+    def _load_music (self, data):
+        if data is None:
+            return
+        # load from memory, so the mixer doesn't read the file
+        pg.mixer.music.load(StringIO(data))
+        pg.mixer.music.play()
+        if self._pause_music:
+            self._pause_music = False
+            pg.mixer.music.pause()
+
     def _update (self):
-        """Update backends and draw."""
+        """Update backends; called every frame."""
+        ft = self.frame_timer
+        if self._timing:
+            # don't count time spent waiting since the last update (timeouts
+            # run after it were already marked)
+            ft.skip()
+        else:
+            # first frame since the last draw
+            ft.start()
+            self.frame += 1
+            self._updates = 0
+            self._timing = True
+        self._updates += 1
         self._update_again = True
         while self._update_again:
             self._update_again = False
             self.backend.event_handler.update()
+            ft.mark('events')
             # if a new backend was created during the above call, we'll end up
             # updating twice before drawing
             if not self._update_again:
                 self._update_again = False
                 self.backend.update()
-        backend = self.backend
+                ft.mark('update')
         # fade
         if self.fading:
             frame = self.scheduler.timer.frame
@@ -434,66 +747,197 @@ volume: float to scale volume by.
             else:
                 self.set_overlay(o)
                 data[3] += frame
+        ft.mark('fade')
+        return True
+
+    def _end_update (self):
+        """Called by the scheduler after each frame's timeouts."""
+        if not self._timing:
+            return
+        # the timeouts after _update (which was added first, so runs first)
+        ft = self.frame_timer
+        ft.mark('timeouts')
+        if not self.drawing:
+            self._timing = False
+            ft.end()
+
+    def _draw (self, interp):
+        """Draw the current backend; called by the scheduler between frames."""
+        if not self.drawing:
+            return
+        ft = self.frame_timer
+        if self._timing:
+            # don't count waiting since the last frame's timeouts
+            ft.skip()
+        else:
+            # no frames run since the last draw
+            ft.start()
+            self.frame += 1
+            self._updates = 0
+        self._timing = False
+        self.interp = interp
+        backend = self.backend
         # check overlay
         o0 = self._last_overlay
         o = self.overlay
-        o_same = o == o0
-        draw = True
+        opaque = False
         if isinstance(o, pg.Surface):
             o_colour = False
-            if o.get_alpha() is None and o.get_colorkey() is None:
-                # opaque: don't draw
-                draw = False
+            opaque = o.get_alpha() is None and o.get_colorkey() is None
         elif o is not False:
             if len(o) == 4 and o[3] == 0:
                 o = False
             else:
                 o_colour = True
-                if len(o) == 3 or o[3] == 255:
-                    # opaque: don't draw
-                    draw = False
-        s = self._overlay_sfc
+                opaque = len(o) == 3 or o[3] == 255
+        o_changed = o != o0
+        if o_changed and (o is False) != (o0 is False):
+            # switching between drawing to the screen and to the base surface
+            backend.dirty = True
         # draw backend
         screen = self.screen
-        if draw:
-            dirty = backend.dirty
+        base = self._base_sfc
+        draw = False
+        if o is False:
             draw = backend.draw(screen)
-            # if (overlay changed or drew something but perhaps not
-            # everything), and we have an overlay (we know this will be
-            # transparent), then draw everything (if dirty already drew
-            # everything)
-            if (draw or o != o0) and o is not False and not dirty:
-                backend.dirty = True
-                new_draw = backend.draw(screen)
-                # merge draw and new_draw
-                if True in (draw, new_draw):
-                    draw = True
+        elif not opaque:
+            # with a transparent overlay, the backend draws to the cached
+            # un-overlaid frame, which we composite with the overlay
+            draw = backend.draw(base)
+        ft.mark('draw')
+        if o is not False:
+            # update overlay surface if changed
+            if o_changed:
+                if o_colour:
+                    self._overlay_sfc.fill(o)
+                    self._overlay = self._overlay_sfc
                 else:
-                    # know draw != False and now draw != True so is rect list
-                    draw = list(draw) + (list(new_draw) if new_draw else [])
-        # update overlay surface if changed
-        if o not in (o0, False):
-            if o_colour:
-                s.fill(o)
-            else:
-                s = o
-        # draw overlay if changed or backend drew
-        if o is not False and (o != o0 or draw):
-            screen.blit(s, (0, 0))
-            draw = True
-            if o != o0:
+                    self._overlay = o
+            s = self._overlay
+            if o_changed or draw is True:
+                # composite everything
+                if not opaque:
+                    screen.blit(base, (0, 0))
+                screen.blit(s, (0, 0))
+                draw = True
+            elif draw:
+                # composite only what the backend drew
+                for r in draw:
+                    screen.blit(base, r, r)
+                    screen.blit(s, r, r)
+            if opaque:
+                # the backend isn't drawing, so base is out of date
                 backend.dirty = True
-        self._last_overlay = self.overlay
+        self._last_overlay = o
+        if self.hud:
+            draw = self._draw_hud(screen, draw)
+        ft.mark('overlay')
         # update display
+        w, h = conf.RES
+        if draw and draw is not True:
+            # update merged rects unless they cover most of the screen
+            draw = merge_rects(draw, screen.get_rect())
+            area = sum(r.w * r.h for r in draw)
+            if area >= conf.PRESENT_FLIP_AREA * w * h:
+                draw = True
+            else:
+                pg.display.update(draw)
+                self.presented = area
         if draw is True:
             pg.display.flip()
-        elif draw:
-            pg.display.update(draw)
-        return True
+            self.presented = w * h
+        elif not draw:
+            self.presented = 0
+        ft.mark('present')
+        if self.presented:
+            self.latency.presented(draw)
+        ft.end()
+        # adapt draw rate to how long frames take; when catching up, a draw
+        # covers several updates, so only count one update's worth of time
+        timer = self.scheduler.timer
+        if self.governor is not None and timer.throttle:
+            t_update = sum(ft.last(p) for p in ('events', 'update', 'fade',
+                                                'timeouts'))
+            t = ft.last() - t_update + t_update / max(self._updates, 1)
+            fps = self.governor.add(t)
+            if fps is not None:
+                timer.set_draw_fps(fps)
+
+    def _draw_hud (self, screen, draw):
+        """Draw the frame timing HUD; takes and returns what to update."""
+        sfc = self._hud_sfc
+        new = sfc is None or self.frame % conf.HUD_INTERVAL == 0
+        if new:
+            summary = self.frame_timer.summary()
+            keys = ('p50', 'p95', 'p99', 'max')
+            lines = ['{0}: {1:.1f} {2:.1f} {3:.1f} {4:.1f}'.format(
+                p, *(1000 * summary[p][k] for k in keys)
+            ) for p in self.frame_timer.phases]
+            lines.append('presented: {0}px'.format(self.presented))
+            if self.governor is not None:
+                lines.append('draw fps: {0}'.format(self.governor.fps))
+            late = self.scheduler.timer.lateness()
+            lines.append('late: {0:.1f} {1:.1f} {2:.1f} {3:.1f}'.format(
+                *(1000 * late[k] for k in keys)
+            ))
+            for kind, s in sorted(self.latency.summary().iteritems()):
+                lines.append('{0}: {1:.0f} {2:.0f} {3:.0f}'.format(
+                    kind, *(1000 * s[k] for k in ('p50', 'p95', 'max'))
+                ))
+            text = self.render_text('hud', '\n'.join(lines), conf.HUD_COLOUR,
+                                    bg = conf.HUD_BG,
+                                    pad = conf.HUD_PADDING)[0]
+            # only grow, so the new HUD always covers the old one
+            w, h = text.get_size()
+            if sfc is None or w > sfc.get_width() or h > sfc.get_height():
+                if sfc is not None:
+                    w = max(w, sfc.get_width())
+                    h = max(h, sfc.get_height())
+                sfc = self._hud_sfc = pg.Surface((w, h)).convert()
+            sfc.fill(conf.HUD_BG)
+            sfc.blit(text, (0, 0))
+        if new or draw:
+            r = screen.blit(sfc, conf.HUD_POS)
+            if draw is not True:
+                draw = list(draw) + [r] if draw else [r]
+        return draw
+
+    def toggle_hud (self, *args):
+        """Show or hide the frame timing HUD.
+
+The HUD shows the 50th, 95th and 99th percentile and maximum times, in
+milliseconds, for each phase of recent frames (see Game.frame_timer), and the
+number of pixels updated on the display in the last frame, the draw rate chosen
+by Game.governor, and the same statistics for how late frames have started (see
+sched.Timer.lateness).
+
+"""
+        if self.fonts is None:
+            return
+        self.hud = not self.hud
+        self._hud_sfc = None
+        if not self.hud:
+            self.backend.dirty = True
+
+    def dump_frame_times (self, fn = None):
+        """Write recorded frame times to a file.
+
+dump_frame_times([fn])
+
+fn: filename to write to; defaults to conf.FRAME_TIMES_FILE.
+
+See frametime.FrameTimer.dump for the format.
+
+"""
+        if fn is None:
+            fn = conf.FRAME_TIMES_FILE
+        self.frame_timer.dump(fn)
 
     def run (self, n = None):
         """Main loop."""
         self.scheduler.run(n)
+        if self.scheduler.profile:
+            self.scheduler.dump_profile(conf.CALLBACK_PROFILE_FILE)
 
     def quit (self, event = None):
         """Quit the game."""
@@ -563,7 +1007,15 @@ Takes the persist argument taken by Game.fade.
 
     def _colour_fade_fn (self, t):
         """Fade function for Game.colour_fade."""
-        f, os, ts = self._fade_data['colour']
+        data = self._fade_data
+        if 'frames' in data:
+            # precomputed
+            frame, os = data['frames']
+            return os[min(ir(t / frame), len(os) - 1)]
+        return self._fade_colour(t, *data['colour'])
+
+    def _fade_colour (self, t, f, os, ts):
+        """Get the overlay for Game.colour_fade at the given time."""
         t = f(t)
         # get waypoints we're between
         i = bisect(ts, t)
@@ -588,7 +1040,8 @@ Takes the persist argument taken by Game.fade.
                 if x1 is None:
                     # both are no overlay: colour doesn't matter
                     o.append(0)
-                o.append(x1)
+                else:
+                    o.append(x1)
             elif x1 is None:
                 o.append(x0)
             else:
@@ -657,7 +1110,24 @@ See Game.fade for more details.
         # start fade
         persist = kwargs.get('persist', False)
         self.fade(self._colour_fade_fn, time, persist)
-        self._fade_data['colour'] = (fn, os, ts)
+        data = self._fade_data
+        data['colour'] = (fn, os, ts)
+        if time is not None:
+            # precompute the overlay for every frame, rounded so that the
+            # overlay only changes (and is redrawn) when it looks different
+            frame = self.scheduler.timer.frame
+            frames = []
+            colour = data['colour']
+            for i in xrange(ir(float(time) / frame) + 1):
+                o = self._fade_colour(i * frame, *colour)
+                if ir(o[3]) == 0:
+                    o = False
+                else:
+                    o = tuple(ir(x) for x in o)
+                    if o[3] == 255:
+                        o = o[:3]
+                frames.append(o)
+            data['frames'] = (frame, frames)
 
     def linear_fade (self, *ws, **kwargs):
         """Start a linear fade on the current backend.
@@ -687,14 +1157,20 @@ Takes the same arguments as Game.colour_fade, without fn and time.
             r[0] = min(r[0], r[1] * ratio)
             r[1] = min(r[1], r[0] / ratio)
         conf.RES = r
-        self.screen = pg.display.set_mode(conf.RES, flags)
+        depth = display_depth(conf.HEADLESS_DEPTH)
+        self.screen = pg.display.set_mode(conf.RES, flags, depth)
         self._overlay_sfc = pg.Surface(conf.RES).convert_alpha()
+        # last frame drawn by the backend, without the overlay
+        self._base_sfc = pg.Surface(conf.RES).convert()
+        # force the overlay to be redrawn on the new surfaces
+        self._last_overlay = False
         try:
             self.backend.dirty = True
         except AttributeError:
             pass
-        # clear image cache (very unlikely we'll need the same sizes)
-        self.img_cache = {}
+        # clear image cache (very unlikely we'll need the same sizes), but keep
+        # pins so the level's images are still kept once they're rescaled
+        self.img_cache.clear(True)
 
     def toggle_fullscreen (self, *args):
         """Toggle fullscreen mode."""
@@ -720,12 +1196,143 @@ Takes the same arguments as Game.colour_fade, without fn and time.
         self.refresh_display()
 
 
+def _list_music (d):
+    """Get music filenames in the given directory, for Game.find_music."""
+    try:
+        files = os.listdir(d)
+    except OSError:
+        # no directory
+        return []
+    return [d + f for f in files if os.path.isfile(d + f)]
+
+
+def _read_file (fn):
+    """Get a file's contents, or None if it can't be read."""
+    try:
+        with open(fn, 'rb') as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def headless_game (level = 0, seed = None, draw = False):
+    """Create a game that runs as fast as possible.
+
+headless_game(level = 0[, seed], draw = False) -> game
+
+level: the index of the level to run.
+seed: seed for the random number generator, to make the run deterministic.
+draw: whether to draw (see Game.drawing).
+
+Frames are not throttled: fps is only used to convert times to numbers of
+frames, as usual.  With the 'headless' and 'bench' commands, this uses SDL's
+dummy video and audio drivers, so needs no display.
+
+"""
+    if seed is not None:
+        seed_random(seed)
+    game = Game(level_backends[level], level)
+    game.drawing = draw
+    game.scheduler.timer.throttle = False
+    return game
+
+
+def simulate (level = 0, frames = None, seed = None, draw = False):
+    """Run a level as fast as possible.
+
+simulate(level = 0[, frames][, seed], draw = False) -> (game, t)
+
+level, seed, draw: as taken by headless_game.
+frames: the number of frames to run for; defaults to until the game quits.
+
+game: the Game instance.
+t: the time taken to run, in seconds.
+
+"""
+    game = headless_game(level, seed, draw)
+    t0 = time()
+    game.run(frames)
+    return (game, time() - t0)
+
+
+def simulate_replay (fn, draw = False):
+    """Replay recorded input as fast as possible.
+
+simulate_replay(fn, draw = False) -> (game, t)
+
+fn: a file written by a replay.Recorder.
+draw: as taken by headless_game.
+
+game, t: as returned by simulate.
+
+The game is seeded and started on the level from the recording, and runs until
+the recorded input ends.
+
+"""
+    player = replay.Player(fn)
+    game = headless_game(player.level, player.seed, draw)
+    player.end = game.quit
+    game.set_input(player)
+    t0 = time()
+    game.run()
+    return (game, time() - t0)
+
+
 if __name__ == '__main__':
     if conf.WINDOW_ICON is not None:
         pg.display.set_icon(pg.image.load(conf.WINDOW_ICON))
     if conf.WINDOW_TITLE is not None:
         pg.display.set_caption(conf.WINDOW_TITLE)
-    if len(argv) >= 2 and argv[1] == 'profile':
+    if len(argv) >= 2 and argv[1] == 'atlas':
+        # build atlases
+        pg.display.set_mode((1, 1))
+        for d in conf.ATLAS_DIRS:
+            print '{0}: {1} page(s)'.format(d, atlas.build(d))
+    elif len(argv) >= 2 and argv[1] == 'bench':
+        from game import bench
+        bench.run(headless_game, *argv[2:])
+    elif len(argv) >= 2 and argv[1] == 'headless':
+        # headless [level [frames [seed [draw]]]]
+        args = [int(arg) for arg in argv[2:6]]
+        args += [0, conf.DEFAULT_HEADLESS_FRAMES, 0, 0][len(args):]
+        level, frames, s, draw = args
+        game, t = simulate(level, frames, s, bool(draw))
+        print '{0} frames in {1:.3f}s ({2:.1f} frames/s)'.format(
+            game.frame, t, game.frame / t
+        )
+    elif len(argv) >= 2 and argv[1] == 'record':
+        # record [level [file]]
+        level = int(argv[2]) if len(argv) >= 3 else 0
+        fn = argv[3] if len(argv) >= 4 else conf.REPLAY_FILE
+        s = Random().getrandbits(32)
+        seed_random(s)
+        game = Game(level_backends[level], level)
+        recorder = replay.Recorder(fn, s, level)
+        game.set_input(recorder)
+        game.run()
+        recorder.close()
+        print 'recorded {0} frames to {1}'.format(recorder.frame, fn)
+    elif len(argv) >= 2 and argv[1] == 'replay':
+        # replay [file [draw]]
+        fn = argv[2] if len(argv) >= 3 else conf.REPLAY_FILE
+        draw = len(argv) >= 4 and bool(int(argv[3]))
+        game, t = simulate_replay(fn, draw)
+        print '{0} frames in {1:.3f}s ({2:.1f} frames/s)'.format(
+            game.frame, t, game.frame / t
+        )
+        s = game.frame_timer.summary()['total']
+        print 'frame times (last {0}): {1:.2f}/{2:.2f}/{3:.2f}/{4:.2f}ms ' \
+              '(p50/p95/p99/max)'.format(
+            game.frame_timer.n,
+            *[1000 * s[k] for k in ('p50', 'p95', 'p99', 'max')]
+        )
+        for kind, s in sorted(game.latency.summary().iteritems()):
+            print '{0} latency ({1}): {2:.1f}/{3:.1f}/{4:.1f}/{5:.1f}ms ' \
+                  '(p50/p95/p99/max), up to {6:.1f}ms queued'.format(
+                kind, s['n'],
+                *[1000 * s[k] for k in ('p50', 'p95', 'p99', 'max', 'queued')]
+            )
+    elif len(argv) >= 2 and argv[1] == 'profile':
         # profile
         from cProfile import run
         from pstats import Stats
@@ -735,9 +1342,30 @@ if __name__ == '__main__':
             t = conf.DEFAULT_PROFILE_TIME
         t *= conf.FPS[None]
         fn = conf.PROFILE_STATS_FILE
-        run('Game(Level).run(t)', fn, locals())
+        run('Game(level_backends[0]).run(t)', fn, locals())
         Stats(fn).strip_dirs().sort_stats('cumulative').print_stats(20)
         os.unlink(fn)
+    elif len(argv) >= 2 and argv[1] == 'sample':
+        # sampling profiler: sample [time [level]]
+        from game.profiler import SamplingProfiler
+        t = int(argv[2]) if len(argv) >= 3 else conf.DEFAULT_PROFILE_TIME
+        level = int(argv[3]) if len(argv) >= 4 else 0
+        game = Game(level_backends[level], level)
+        timer = game.scheduler.timer
+        # the current draw rate, as chosen by the governor
+        profiler = SamplingProfiler(game, get_backend_id,
+                                    lambda i: timer.draw_frame or timer.frame,
+                                    conf.PROFILE_SAMPLE_INTERVAL)
+        profiler.start()
+        game.run(t * conf.FPS[None])
+        profiler.stop()
+        profiler.write_collapsed(conf.PROFILE_STACKS_FILE)
+        profiler.write_slow_frames(conf.PROFILE_SLOW_FRAMES_FILE)
+        print '{0} samples in {1} frames; {2} frames over budget'.format(
+            profiler.n_samples, game.frame, len(profiler.slow_frames)
+        )
+        print 'wrote {0}, {1}'.format(conf.PROFILE_STACKS_FILE,
+                                      conf.PROFILE_SLOW_FRAMES_FILE)
     else:
         level = 0
         if len(argv) >= 2:
@@ -748,4 +1376,4 @@ if __name__ == '__main__':
             restarting = False
             Game(level_backends[level], level).run()
 
-pg.quit()
+    pg.quit()
@@ -0,0 +1,170 @@
+import os
+import json
+
+import pygame as pg
+
+from conf import conf
+
+# gap between packed images, in pixels
+PADDING = 1
+
+
+def _sources (d):
+    # get image filenames in a directory, and their latest modification time
+    try:
+        fns = sorted(fn for fn in os.listdir(d) if fn.endswith('.png'))
+    except OSError:
+        return ([], None)
+    mtime = max([os.path.getmtime(os.path.join(d, fn)) for fn in fns] or [0])
+    return (fns, mtime)
+
+
+def pack (sizes, max_size):
+    """Pack rectangles into pages using a simple shelf algorithm.
+
+pack(sizes, max_size) -> (pages, placements)
+
+sizes: {key: (width, height)} dict of rectangles to pack.
+max_size: (width, height) maximum size of a page.  Rectangles larger than this
+          get a page to themselves.
+
+pages: a list of (width, height) sizes of the pages used.
+placements: {key: (page, x, y)} dict giving the index of the page each rectangle
+            is put on, and its position in that page.
+
+"""
+    max_w, max_h = max_size
+    pages = []
+    placements = {}
+    # tallest first, so shelves waste less space
+    order = sorted(sizes, key = lambda k: (-sizes[k][1], -sizes[k][0], k))
+    page = x = y = shelf_h = 0
+    page_w = page_h = 0
+    for k in order:
+        w, h = sizes[k]
+        if x > 0 and x + w > max_w:
+            # start a new shelf
+            y += shelf_h + PADDING
+            x = shelf_h = 0
+        if y > 0 and y + h > max_h:
+            # start a new page
+            pages.append((page_w, page_h))
+            page += 1
+            x = y = shelf_h = page_w = page_h = 0
+        placements[k] = (page, x, y)
+        x += w + PADDING
+        shelf_h = max(shelf_h, h)
+        page_w = max(page_w, x - PADDING)
+        page_h = max(page_h, y + h)
+    if placements:
+        pages.append((page_w, page_h))
+    return (pages, placements)
+
+
+def _opaque (img):
+    # whether an image has no transparent pixels
+    if img.get_alpha() is None and img.get_colorkey() is None:
+        return True
+    if not img.get_flags() & pg.SRCALPHA:
+        return False
+    w, h = img.get_size()
+    return pg.mask.from_surface(img, 254).count() == w * h
+
+
+def _index_fn (ident):
+    return os.path.join(conf.ATLAS_DIR, ident + '.json')
+
+
+def _page_fn (ident, page):
+    return os.path.join(conf.ATLAS_DIR, '{0}-{1}.png'.format(ident, page))
+
+
+def build (ident):
+    """Pack the images in a directory into atlas files.
+
+build(ident) -> n_pages
+
+ident: the directory under conf.IMG_DIR to pack.
+
+n_pages: the number of atlas pages written.
+
+Writes the pages as PNG files and an index as JSON to conf.ATLAS_DIR.  Images
+with no transparent pixels (such as circuit/bg.png) are packed onto separate
+pages without an alpha channel, so they keep the faster opaque blit.
+
+"""
+    d = os.path.join(conf.IMG_DIR, ident)
+    fns, mtime = _sources(d)
+    imgs = dict((fn, pg.image.load(os.path.join(d, fn))) for fn in fns)
+    sfcs = []
+    alpha = []
+    index = {}
+    for use_alpha in (False, True):
+        sizes = dict((fn, img.get_size()) for fn, img in imgs.iteritems()
+                     if _opaque(img) != use_alpha)
+        pages, placements = pack(sizes, conf.ATLAS_MAX_SIZE)
+        first = len(sfcs)
+        for size in pages:
+            if use_alpha:
+                sfc = pg.Surface(size, pg.SRCALPHA, 32)
+                sfc.fill((0, 0, 0, 0))
+            else:
+                sfc = pg.Surface(size, 0, 32)
+            sfcs.append(sfc)
+            alpha.append(use_alpha)
+        for fn, (page, x, y) in placements.iteritems():
+            page += first
+            sfcs[page].blit(imgs[fn], (x, y))
+            index[fn] = (page, x, y) + sizes[fn]
+    try:
+        os.makedirs(conf.ATLAS_DIR)
+    except OSError:
+        # already exists
+        pass
+    for page, sfc in enumerate(sfcs):
+        pg.image.save(sfc, _page_fn(ident, page))
+    with open(_index_fn(ident), 'w') as f:
+        json.dump({'pages': len(sfcs), 'alpha': alpha, 'imgs': index}, f,
+                  indent = 4)
+    return len(sfcs)
+
+
+def load (ident):
+    """Load an image directory's atlas, if it exists and is up to date.
+
+load(ident) -> (pages, imgs)
+
+ident: the directory under conf.IMG_DIR, as passed to build.
+
+pages: a list of the loaded page surfaces, converted for blitting (with
+       convert for opaque pages and convert_alpha for the rest).
+imgs: {filename: surface} dict of subsurfaces of pages for each image in the
+      directory.
+
+If the atlas hasn't been built, or any image in the directory has changed or
+been added or removed since it was, the return value is None.
+
+"""
+    fns, mtime = _sources(os.path.join(conf.IMG_DIR, ident))
+    index_fn = _index_fn(ident)
+    try:
+        if os.path.getmtime(index_fn) < mtime:
+            return None
+        with open(index_fn) as f:
+            index = json.load(f)
+    except (OSError, IOError, ValueError):
+        return None
+    if sorted(index['imgs']) != fns or 'alpha' not in index:
+        # changed, or built before opaque pages were separate
+        return None
+    try:
+        pages = [pg.image.load(_page_fn(ident, page))
+                 for page in xrange(index['pages'])]
+    except pg.error:
+        return None
+    pages = [sfc.convert_alpha() if use_alpha else sfc.convert()
+             for sfc, use_alpha in zip(pages, index['alpha'])]
+    imgs = {}
+    for fn, (page, x, y, w, h) in index['imgs'].iteritems():
+        imgs[fn] = pages[page].subsurface((x, y, w, h))
+    return (pages, imgs)
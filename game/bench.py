@@ -0,0 +1,373 @@
+import os
+import json
+from multiprocessing import Pool
+from random import Random
+from timeit import default_timer as time
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+import pygame as pg
+
+from conf import conf
+from util import convert_sfc, display_depth
+from frametime import percentile
+import atlas as atlas_module
+from ext.sched import Scheduler
+from profiler import SamplingProfiler
+
+
+def _best (f, repeat):
+    # best time of several runs, to reduce noise
+    t = None
+    for i in xrange(repeat):
+        t0 = time()
+        f()
+        dt = time() - t0
+        t = dt if t is None else min(t, dt)
+    return t
+
+
+def _report (name, t_without, t_with, unit = 'ms'):
+    scale = {'ms': 1000, 'us': 10 ** 6}[unit]
+    print '{0}: {1:.3f}{4} without, {2:.3f}{4} with ({3:.2f}x)'.format(
+        name, t_without * scale, t_with * scale, t_without / t_with, unit
+    )
+
+
+def atlas (new_game, repeat = 20, frames = 200):
+    """Compare image loading and blitting with and without atlases.
+
+Builds atlases for conf.ATLAS_DIRS if they aren't up to date.
+
+"""
+    repeat = int(repeat)
+    frames = int(frames)
+    depth = display_depth(conf.HEADLESS_DEPTH)
+    screen = pg.display.set_mode(conf.RES, 0, depth)
+    dirs = conf.ATLAS_DIRS
+    for d in dirs:
+        if atlas_module.load(d) is None:
+            atlas_module.build(d)
+    fns = []
+    for d in dirs:
+        path = os.path.join(conf.IMG_DIR, d)
+        fns += [os.path.join(path, fn) for fn in sorted(os.listdir(path))
+                if fn.endswith('.png')]
+    n_pages = sum(len(atlas_module.load(d)[0]) for d in dirs)
+    print '{0} images, {1} atlas pages'.format(len(fns), n_pages)
+
+    # cold start
+    def load_files ():
+        return [convert_sfc(pg.image.load(fn)) for fn in fns]
+
+    def load_atlases ():
+        imgs = []
+        for d in dirs:
+            imgs += atlas_module.load(d)[1].values()
+        return imgs
+
+    _report('load', _best(load_files, repeat), _best(load_atlases, repeat))
+
+    # blitting every image once per frame
+    w, h = conf.RES
+
+    def blitter (imgs):
+        def blit ():
+            for i in xrange(frames):
+                for j, img in enumerate(imgs):
+                    screen.blit(img, ((j * 37) % w, (j * 53) % h))
+        return blit
+
+    _report('blit per frame', _best(blitter(load_files()), repeat) / frames,
+            _best(blitter(load_atlases()), repeat) / frames, 'us')
+
+
+def scheduler (new_game, frames = 600, *counts):
+    """Time scheduler frames with many pending timeouts.
+
+Arguments are the number of frames to run and then numbers of timeouts to
+schedule (defaulting to 0, 1000, 10000 and 100000).  Timeouts are spread
+randomly over the next 10 seconds; a tenth of them repeat.  The time per frame
+should hardly depend on the number of timeouts pending, only on the number
+that are due.
+
+"""
+    frames = int(frames)
+    counts = [int(n) for n in counts] or [0, 1000, 10000, 100000]
+    rand = Random(conf.BENCH_SEED)
+    for n in counts:
+        s = Scheduler(throttle = False)
+        calls = [0]
+
+        def cb ():
+            calls[0] += 1
+
+        def repeat ():
+            calls[0] += 1
+            return True
+        max_frames = 10 * s.timer.fps
+        for i in xrange(n):
+            f = rand.randint(1, max_frames)
+            if i % 10 == 0:
+                s.add_timeout(repeat, frames = f)
+            else:
+                s.add_timeout(cb, frames = f)
+        t0 = time()
+        s.run(frames)
+        t = time() - t0
+        print '{0} timeouts: {1:.2f}us per frame, {2} calls'.format(
+            n, 10 ** 6 * t / frames, calls[0]
+        )
+
+
+def _stall (t):
+    # keep busy (so the profiler sees this function) for t seconds
+    end = time() + t
+    while time() < end:
+        pass
+
+
+def profiler (new_game, frames = 300, every = 20, stall = 50):
+    """Check that the sampling profiler catches deliberately slow frames.
+
+Arguments are the number of frames to run, how often (in frames) to stall, and
+for how long (in milliseconds).  Stalls alternate between the backend's update
+and a scheduled timeout; those frames should be reported as over budget, with
+samples in the stalling function.
+
+"""
+    frames, every = int(frames), int(every)
+    stall = int(stall) / 1000.
+    game = new_game(0, conf.BENCH_SEED, True)
+    backend = game.backend
+    update = backend.update
+    stalled = set()
+
+    def slow_update ():
+        update()
+        if game.frame % (2 * every) == 0:
+            stalled.add(game.frame)
+            _stall(stall)
+
+    def slow_timeout ():
+        if game.frame % (2 * every) == every:
+            stalled.add(game.frame)
+            _stall(stall)
+        return True
+    backend.update = slow_update
+    game.scheduler.add_timeout(slow_timeout, frames = 1, repeat_frames = 1)
+    prof = SamplingProfiler(game, lambda b: type(b).__name__,
+                            lambda i: stall / 2,
+                            conf.PROFILE_SAMPLE_INTERVAL)
+    prof.start()
+    game.run(frames)
+    prof.stop()
+    caught = dict((f, samples) for f, b, t, samples in prof.slow_frames)
+    missed = sorted(stalled - set(caught))
+    in_stall = [sum('bench.py:_stall' in s for s in caught[f])
+                for f in stalled if f in caught]
+    print '{0} stalled frames: {1} caught, {2} missed{3}'.format(
+        len(stalled), len(stalled) - len(missed), len(missed),
+        ' ({0})'.format(missed) if missed else ''
+    )
+    print '{0} other frames reported slow; samples in the stall: ' \
+          '{1} per caught frame'.format(len(set(caught) - stalled), in_stall)
+    print 'ok' if not missed and all(in_stall) else 'FAILED'
+
+
+# scenarios: each function takes a started game, sets up the scenario and
+# returns a function to call every frame, or None
+
+
+def _idle_setup (game):
+    # frog sitting next to the road
+    game.backend.frog.pos = [7, 10]
+
+
+def _crash_setup (game):
+    # crash immediately (in a lower lane) and run the whole cutscene
+    game.backend.road.crash((7, 8))
+
+
+def _pathfind_setup (game):
+    frog = game.backend.frog
+    frog.pos = [7, 10]
+
+    def step ():
+        frog.get_path((7, 2))
+    return step
+
+
+def _circuit_setup (game):
+    game.backend.circuit.show()
+
+
+def _hover_setup (game):
+    # move the mouse quickly between objects and empty tiles
+    tiles = [(3, 13), (2, 13), (5, 12), (7, 12), (10, 3)]
+    sx, sy = conf.TILE_SIZE
+    state = {'i': 0}
+
+    def step ():
+        i = state['i']
+        for j in xrange(conf.BENCH_HOVER_EVENTS):
+            x, y = tiles[(i + j) % len(tiles)]
+            pos = (x * sx + j % sx, y * sy + sy / 2)
+            pg.event.post(pg.event.Event(pg.MOUSEMOTION, pos = pos,
+                                         rel = (1, 0), buttons = (0, 0, 0)))
+        state['i'] = i + 1
+    return step
+
+
+# name: (level, frames, setup)
+scenarios = {
+    'idle': (0, 600, _idle_setup),
+    'crash': (0, 800, _crash_setup),
+    'pathfind': (0, 300, _pathfind_setup),
+    'circuit': (1, 600, _circuit_setup),
+    'hover': (0, 300, _hover_setup)
+}
+
+
+def _peak_memory ():
+    # peak resident memory of this process in KiB, or None
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_scenario (new_game, name):
+    """Run a scenario and return its results.
+
+run_scenario(new_game, name) -> results
+
+new_game: function that takes level and seed arguments and returns a Game that
+          runs as fast as possible (such as game.headless_game).
+name: key in the scenarios dict.
+
+results: a dict with keys 'fps', 'p50', 'p95', 'p99' and 'max' (frame times in
+         seconds), 'presented' (mean pixels updated on the display per frame)
+         and 'peak_mem' (the process's peak resident memory so far, in KiB, or
+         None if unknown).  Since the peak is for the whole process, use
+         run_isolated to get a peak for just this scenario.
+
+"""
+    level, frames, setup = scenarios[name]
+    game = new_game(level, conf.BENCH_SEED, True)
+    step = setup(game)
+    # frames aren't throttled, so the time between calls is the time taken by
+    # everything run in a frame
+    stamps = []
+    presented = [0]
+
+    def cb ():
+        if step is not None:
+            step()
+        stamps.append(time())
+        presented[0] += game.presented
+        return True
+    game.scheduler.add_timeout(cb, frames = 1)
+    t0 = time()
+    game.run(frames)
+    t = time() - t0
+    ts = sorted(t1 - t0 for t0, t1 in zip([t0] + stamps, stamps))
+    return {'fps': len(stamps) / t, 'p50': percentile(ts, 50),
+            'p95': percentile(ts, 95), 'p99': percentile(ts, 99),
+            'max': ts[-1], 'presented': float(presented[0]) / len(stamps),
+            'peak_mem': _peak_memory()}
+
+
+def run_isolated (new_game, name):
+    """Run a scenario in a new process, and return its results.
+
+Takes the same arguments and returns the same results as run_scenario, except
+that 'peak_mem' is for the new process only.  The process is forked, so it
+starts with this process's memory, but not any earlier scenario's.  Where peak
+memory isn't available, this is the same as run_scenario.
+
+"""
+    if resource is None:
+        return run_scenario(new_game, name)
+    pool = Pool(1)
+    try:
+        return pool.apply(run_scenario, (new_game, name))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def scenarios_bench (new_game, *args):
+    """Run scenarios and compare with the stored baseline.
+
+Arguments are scenario names to run (defaulting to all of them), and optionally
+'save' to store the results as the new baseline (conf.BENCH_BASELINE_FILE).
+Scenarios that fail to start are reported and skipped.  Each runs in its own
+process (see run_isolated), so peak memory figures are per scenario.
+
+"""
+    save = 'save' in args
+    names = [a for a in args if a != 'save'] or sorted(scenarios)
+    try:
+        with open(conf.BENCH_BASELINE_FILE) as f:
+            baseline = json.load(f)
+    except (IOError, ValueError):
+        baseline = {}
+    results = {}
+    for name in names:
+        try:
+            r = results[name] = run_isolated(new_game, name)
+        except pg.error, e:
+            print '{0}: failed: {1}'.format(name, e)
+            continue
+        line = '{0}: {1:.1f} frames/s, {2:.2f}/{3:.2f}/{4:.2f}/{5:.2f}ms ' \
+               '(p50/p95/p99/max), {6:.0f}px/frame'.format(
+            name, r['fps'],
+            *([1000 * r[k] for k in ('p50', 'p95', 'p99', 'max')] +
+              [r['presented']])
+        )
+        if r['peak_mem'] is not None:
+            line += ', peak {0}KiB'.format(r['peak_mem'])
+        print line
+        if name in baseline:
+            b = baseline[name]
+            print '    vs baseline: frames/s {0:+.1f}%, p95 {1:+.1f}%'.format(
+                100. * (r['fps'] / b['fps'] - 1),
+                100. * (r['p95'] / b['p95'] - 1) if b['p95'] else 0
+            )
+    if save:
+        baseline.update(results)
+        d = os.path.dirname(conf.BENCH_BASELINE_FILE)
+        try:
+            os.makedirs(d)
+        except OSError, e:
+            if e.errno != 17: # 17 means already exists
+                print 'warning: can\'t create directory: \'{0}\''.format(d)
+        with open(conf.BENCH_BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent = 4, sort_keys = True)
+        print 'saved baseline to ' + conf.BENCH_BASELINE_FILE
+
+
+benchmarks = {
+    'atlas': atlas,
+    'profiler': profiler,
+    'scenarios': scenarios_bench,
+    'scheduler': scheduler
+}
+
+
+def run (new_game, name = None, *args):
+    """Run a benchmark by name.
+
+run(new_game[, name], *args)
+
+new_game: as taken by run_scenario.
+args: extra (string) arguments to pass to the benchmark.
+
+"""
+    if name not in benchmarks:
+        print 'available benchmarks: ' + ', '.join(sorted(benchmarks))
+        return
+    benchmarks[name](new_game, *args)
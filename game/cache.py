@@ -0,0 +1,202 @@
+from collections import OrderedDict
+from itertools import chain
+
+import pygame as pg
+
+
+def sfc_bytes (value):
+    """Return the memory used by a cached value, in bytes.
+
+sfc_bytes(value) -> size
+
+value: a pygame.Surface, or a tuple or list containing any number of them (other
+       items are ignored).
+
+Subsurfaces share their parent's pixels, so they are counted as using none.
+
+"""
+    if isinstance(value, pg.Surface):
+        if value.get_parent() is not None:
+            return 0
+        return value.get_pitch() * value.get_height()
+    elif isinstance(value, (tuple, list)):
+        return sum(sfc_bytes(v) for v in value)
+    else:
+        return 0
+
+
+class Cache (object):
+    """A dict-like least-recently-used cache with a memory budget.
+
+    CONSTRUCTOR
+
+Cache(budget = None, size_fn = sfc_bytes)
+
+budget: the maximum total size of the stored values, or None for no limit.
+size_fn: a function that takes a value and returns its size, in the same units
+         as budget.
+
+Use the dict interface to store and retrieve values.  Whenever the total size of
+the stored values exceeds the budget, the least recently stored or retrieved
+values are dropped until it doesn't.  Pinned values are never dropped, but still
+count towards the total size.
+
+    METHODS
+
+has
+pin
+unpin
+unpin_all
+clear
+reset_stats
+stats
+
+    ATTRIBUTES
+
+budget: as given; may be changed directly, and takes effect on the next store.
+size: the current total size of the stored values.
+hits: the number of successful lookups (including 'key in cache' checks).
+misses: the number of failed lookups.
+evictions: the number of values dropped to stay within the budget.
+pinned: the set of pinned keys.
+
+"""
+
+    def __init__ (self, budget = None, size_fn = sfc_bytes):
+        self.budget = budget
+        self._size_fn = size_fn
+        # unpinned values, least recently used first, and pinned values, kept
+        # apart so eviction never has to skip over pinned keys
+        self._items = OrderedDict()
+        self._pinned_items = {}
+        self._sizes = {}
+        self.size = 0
+        self.pinned = set()
+        self.reset_stats()
+
+    def __len__ (self):
+        return len(self._items) + len(self._pinned_items)
+
+    def __iter__ (self):
+        return chain(self._pinned_items, self._items)
+
+    def __contains__ (self, key):
+        if self.has(key):
+            self.hits += 1
+            return True
+        else:
+            self.misses += 1
+            return False
+
+    def __getitem__ (self, key):
+        if key in self._pinned_items:
+            return self._pinned_items[key]
+        # move to the most recently used end
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+    def get (self, key, default = None):
+        if key in self:
+            return self[key]
+        else:
+            return default
+
+    def has (self, key):
+        """Check whether a key is stored without affecting statistics."""
+        return key in self._items or key in self._pinned_items
+
+    def __setitem__ (self, key, value):
+        if self.has(key):
+            self._discard(key)
+        size = self._size_fn(value)
+        if key in self.pinned:
+            self._pinned_items[key] = value
+        else:
+            self._items[key] = value
+        self._sizes[key] = size
+        self.size += size
+        self._evict()
+
+    def __delitem__ (self, key):
+        self._discard(key)
+        self.pinned.discard(key)
+
+    def _discard (self, key):
+        if key in self._pinned_items:
+            del self._pinned_items[key]
+        else:
+            del self._items[key]
+        self.size -= self._sizes.pop(key)
+
+    def _evict (self):
+        # drop least recently used unpinned values until within budget
+        budget = self.budget
+        if budget is None:
+            return
+        items = self._items
+        while self.size > budget and items:
+            key = items.popitem(False)[0]
+            self.size -= self._sizes.pop(key)
+            self.evictions += 1
+
+    def pin (self, *keys):
+        """Stop the values with the given keys from being evicted.
+
+Keys need not be stored yet.
+
+"""
+        self.pinned.update(keys)
+        items = self._items
+        for key in keys:
+            if key in items:
+                self._pinned_items[key] = items.pop(key)
+
+    def unpin (self, *keys):
+        """Allow the values with the given keys to be evicted again."""
+        self.pinned.difference_update(keys)
+        pinned_items = self._pinned_items
+        for key in keys:
+            if key in pinned_items:
+                # as if just used
+                self._items[key] = pinned_items.pop(key)
+        self._evict()
+
+    def unpin_all (self):
+        """Unpin all keys."""
+        self.pinned = set()
+        self._items.update(self._pinned_items)
+        self._pinned_items = {}
+        self._evict()
+
+    def clear (self, keep_pins = False):
+        """Remove all values, and unless keep_pins is True, all pins.
+
+clear(keep_pins = False)
+
+If keep_pins is True, pinned keys stay pinned, so their values are kept when
+they're stored again.
+
+"""
+        self._items.clear()
+        self._pinned_items = {}
+        self._sizes = {}
+        self.size = 0
+        if not keep_pins:
+            self.pinned = set()
+
+    def reset_stats (self):
+        """Reset the hits, misses and evictions counters to 0."""
+        self.hits = self.misses = self.evictions = 0
+
+    def stats (self):
+        """Get a dict of statistics.
+
+Keys are 'hits', 'misses', 'evictions', 'size', 'budget', 'items' and 'pinned',
+the last two being the numbers of stored values and pinned keys.
+
+"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': self.size,
+                'budget': self.budget, 'items': len(self),
+                'pinned': len(self.pinned)}
@@ -4,6 +4,14 @@ from conf import conf
 import level as level_module
 
 
+def img_files ():
+    states = xrange(len(conf.CIRCUIT_STATE_COLOURS))
+    imgs = ['bg', 'arrow', 'pos', 'error']
+    imgs += ['{0}'.format(state) for state in states]
+    imgs += ['{0}-dark'.format(state) for state in states]
+    return [('circuit', img + '.png') for img in imgs]
+
+
 class CircuitPuzzle (object):
     def __init__ (self, level, data):
         self.level = level
@@ -36,6 +36,9 @@ class Conf (object):
     else:
         CONF_DIR = join_path(os.path.expanduser(u'~'), '.config', IDENT)
     CONF = join_path(CONF_DIR, 'conf')
+    IMG_DISK_CACHE_DIR = join_path(CONF_DIR, 'imgcache')
+    # results are machine-specific, so keep them with the user's settings
+    BENCH_BASELINE_FILE = join_path(CONF_DIR, 'bench_baseline.json')
 
     # data paths
     DATA_DIR = u''
@@ -43,31 +46,105 @@ class Conf (object):
     SOUND_DIR = DATA_DIR + 'sound' + sep
     MUSIC_DIR = DATA_DIR + 'music' + sep
     FONT_DIR = DATA_DIR + 'font' + sep
+    ATLAS_DIR = IMG_DIR + 'atlas' + sep
 
     # display
     WINDOW_ICON = IMG_DIR + 'icon.png'
     WINDOW_TITLE = 'Life and Times of Frog?'
     MOUSE_VISIBLE = dd(True) # per-backend
     FLAGS = 0
+    # colour depth to use with SDL's dummy video driver (headless runs), which
+    # otherwise gives an 8-bit display unlike any real one
+    HEADLESS_DEPTH = 32
     FULLSCREEN = False
     RESIZABLE = False # also determines whether fullscreen togglable
     RES_W = (600, 600)
-    RES_F = pg.display.list_modes()[0]
+    RES_F = pg.display.list_modes()
+    # -1 means any resolution is fine (eg. with the dummy video driver)
+    RES_F = RES_F[0] if RES_F and RES_F != -1 else RES_W
     RES = RES_W
     MIN_RES_W = (320, 180)
     ASPECT_RATIO = None
+    # if updated rects cover at least this fraction of the screen, update the
+    # whole display at once instead
+    PRESENT_FLIP_AREA = .5
+
+    # memory budgets for Game's caches, in bytes (None for unlimited)
+    CACHE_BUDGETS = {'file': 16 * 2 ** 20, 'image': 16 * 2 ** 20,
+                     'text': 2 * 2 ** 20}
+
+    # image directories (under IMG_DIR) to load from atlases, if built (see
+    # the 'atlas' command); off by default, since atlases benchmark slower
+    # here, for every directory and for all of them together (see README)
+    USE_ATLASES = False
+    ATLAS_DIRS = ('obj', 'car', 'circuit')
+    ATLAS_MAX_SIZE = (1024, 1024)
+    # store decoded and scaled images in IMG_DISK_CACHE_DIR, so they can be
+    # loaded without decoding or resampling next time; the game doesn't scale
+    # images, so this only saves PNG decoding, for images loaded by Game.img
+    # or Game.preload (about 14 times faster for the whole img directory)
+    USE_IMG_DISK_CACHE = False
 
     # timing
-    FPS = dd(60) # per-backend
+    # per-backend: backends update at a fixed rate of FPS, and draw at most
+    # DRAW_FPS times per second (None to draw after each batch of updates);
+    # setting DRAW_FPS higher than FPS draws in between updates, interpolating
+    # movement
+    FPS = dd(60)
+    DRAW_FPS = dd(None)
+    # per-backend draw rates to choose between, highest first, depending on
+    # how long frames take (replacing DRAW_FPS); a tier is dropped if over
+    # GOVERNOR_MISS of the frames in a window of GOVERNOR_WINDOW miss their
+    # budget, and raised if enough frames would fit in GOVERNOR_HEADROOM of
+    # the higher tier's budget
+    DRAW_FPS_TIERS = dd((60, 40, 30, 20))
+    GOVERNOR_WINDOW = 60
+    GOVERNOR_MISS = .2
+    GOVERNOR_HEADROOM = .6
+    # the most updates to run in a row to catch up when behind; beyond this,
+    # the game slows down
+    MAX_CATCH_UP_FRAMES = 5
+    # seconds before each frame to stop sleeping and wait precisely (using CPU)
+    TIMER_SPIN = .002
 
     # debug
     PROFILE_STATS_FILE = '.profile_stats'
     DEFAULT_PROFILE_TIME = 5
+    # sampling profiler: time between samples, and output files in
+    # collapsed-stack (flamegraph) format
+    PROFILE_SAMPLE_INTERVAL = .001
+    PROFILE_STACKS_FILE = 'profile_stacks'
+    PROFILE_SLOW_FRAMES_FILE = 'profile_slow_frames'
+    # time scheduler callbacks, noting those that take more than
+    # CALLBACK_SLOW_SHARE of a frame, and write a report to
+    # CALLBACK_PROFILE_FILE when Game.run returns
+    PROFILE_CALLBACKS = False
+    CALLBACK_SLOW_SHARE = .5
+    CALLBACK_PROFILE_FILE = 'callback_profile'
+    DEFAULT_HEADLESS_FRAMES = 5000
+    # number of input latencies to keep for each kind of action
+    LATENCY_SIZE = 200
+    # input recording (the 'record' and 'replay' commands)
+    REPLAY_FILE = 'replay'
+    # scenario benchmarks
+    BENCH_SEED = 0
+    BENCH_HOVER_EVENTS = 20 # mouse motion events per frame
+    # frame timing: number of frames to keep, and where Game.dump_frame_times
+    # writes them
+    FRAME_TIMES_SIZE = 600
+    FRAME_TIMES_FILE = 'frame_times'
+    HUD_INTERVAL = 30 # frames between HUD updates
+    HUD_FONT_SIZE = 11
+    HUD_COLOUR = (255, 255, 255)
+    HUD_BG = (0, 0, 0)
+    HUD_PADDING = 3
+    HUD_POS = (0, 0)
 
     # input
     KEYS_NEXT = (pg.K_RETURN, pg.K_SPACE, pg.K_KP_ENTER)
     KEYS_BACK = (pg.K_ESCAPE, pg.K_BACKSPACE)
     KEYS_MINIMISE = (pg.K_F10,)
+    KEYS_HUD = (pg.K_F3,)
     KEYS_FULLSCREEN = (pg.K_F11, (pg.K_RETURN, pg.KMOD_ALT, True),
                     (pg.K_KP_ENTER, pg.KMOD_ALT, True))
     KEYS_LEFT = (pg.K_LEFT, pg.K_a, pg.K_q)
@@ -85,6 +162,12 @@ class Conf (object):
     SOUND_VOLUME = .5
     EVENT_ENDMUSIC = pg.USEREVENT
     SOUND_VOLUMES = dd(1, crash = 1.5)
+    # load all sounds at startup (else on first use)
+    PRELOAD_SOUNDS = True
+    # number of mixer channels reserved for sounds (0 disables sounds)
+    SOUND_CHANNELS = 8
+    # maximum number of each sound playing at once (0 never plays it)
+    SOUND_VOICES = dd(2)
     # generate SOUNDS = {ID: num_sounds}
     SOUNDS = {}
     ss = glob(join_path(SOUND_DIR, '*.ogg'))
@@ -146,6 +229,7 @@ class Conf (object):
     REQUIRED_FONTS = dd({
         'msg': (FONT, MSG_FONT_SIZE),
         'label': (FONT, LABEL_FONT_SIZE),
+        'hud': (FONT, HUD_FONT_SIZE)
     })
     FONT_COLOUR = (255, 230, 200)
     UI_BG = (30, 20, 0, 150)
@@ -0,0 +1,144 @@
+import os
+import struct
+from hashlib import sha1
+
+import pygame as pg
+
+# file format: header, then raw pixel data in the given mode, row by row with no
+# padding, so loading is a single read and no decoding
+MAGIC = 'LATOFIMG1'
+HEADER = struct.Struct('<{0}sIIB'.format(len(MAGIC)))
+MODES = ('RGB', 'RGBA')
+
+
+def display_format ():
+    """Get a hashable description of the display's pixel format, or None."""
+    sfc = pg.display.get_surface()
+    if sfc is None:
+        return None
+    return (sfc.get_bitsize(), sfc.get_masks())
+
+
+class DiskCache (object):
+    """Store scaled images on disk as raw pixel data.
+
+    CONSTRUCTOR
+
+DiskCache(directory)
+
+directory: where to store files; created if necessary.
+
+Entries are keyed by source filename, size (as standardised by Game.img), the
+source file's modification time and the display's pixel format, so changing any
+of these just results in a miss.  Stale files are not removed.
+
+    METHODS
+
+has
+get
+put
+clear
+
+    ATTRIBUTES
+
+dir: as given.
+hits, misses: the number of successful and failed calls to get.
+
+"""
+
+    def __init__ (self, directory):
+        self.dir = directory
+        self.hits = self.misses = 0
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # already exists, or can't create: fail on put instead
+            pass
+
+    def _path (self, src, size):
+        # return the cache filename for an image, or None if the source is gone
+        try:
+            mtime = os.path.getmtime(src)
+        except OSError:
+            return None
+        key = repr((os.path.abspath(src), size, mtime, display_format()))
+        return os.path.join(self.dir, sha1(key).hexdigest())
+
+    def has (self, src, size):
+        """Check whether an image is stored, without loading it.
+
+Takes the same arguments as get.  This doesn't count as a hit or a miss.
+
+"""
+        fn = self._path(src, size)
+        return fn is not None and os.path.isfile(fn)
+
+    def get (self, src, size):
+        """Load a stored image.
+
+get(src, size) -> surface
+
+src: the source image filename.
+size: the size the image was scaled to, as passed to put.
+
+surface: the loaded surface, not yet converted for display, or None if it isn't
+         stored or the source has changed since it was.
+
+"""
+        fn = self._path(src, size)
+        sfc = None
+        if fn is not None:
+            try:
+                with open(fn, 'rb') as f:
+                    data = f.read()
+                magic, w, h, mode = HEADER.unpack_from(data)
+                if magic == MAGIC:
+                    sfc = pg.image.frombuffer(buffer(data, HEADER.size),
+                                              (w, h), MODES[mode])
+            except (IOError, struct.error, IndexError, ValueError):
+                pass
+        if sfc is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return sfc
+
+    def put (self, src, size, sfc):
+        """Store an image.
+
+put(src, size, sfc)
+
+src: the source image filename.
+size: any hashable size identifier.
+sfc: the surface to store.
+
+Failure to write is ignored.
+
+"""
+        fn = self._path(src, size)
+        if fn is None:
+            return
+        mode = int(bool(sfc.get_flags() & pg.SRCALPHA))
+        data = pg.image.tostring(sfc, MODES[mode])
+        tmp = fn + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, sfc.get_width(), sfc.get_height(),
+                                    mode))
+                f.write(data)
+            # don't leave partial files around if interrupted
+            os.rename(tmp, fn)
+        except (IOError, OSError):
+            pass
+
+    def clear (self):
+        """Remove all stored images."""
+        try:
+            fns = os.listdir(self.dir)
+        except OSError:
+            return
+        for fn in fns:
+            try:
+                os.remove(os.path.join(self.dir, fn))
+            except OSError:
+                pass
@@ -56,6 +56,7 @@ included, you can find it here:
 # - joystick stuff
 
 import sys
+from timeit import default_timer as time
 
 import pygame
 
@@ -66,17 +67,43 @@ MODE_ONDOWN = 3
 MODE_ONDOWN_REPEAT = 4
 
 
+# events after which we can't trust our record of pressed keys, since key
+# events might have gone elsewhere
+RESYNC_EVENTS = set(getattr(pygame, name) for name in
+                    ('ACTIVEEVENT', 'WINDOWFOCUSGAINED', 'WINDOWFOCUSLOST')
+                    if hasattr(pygame, name))
+
+
 def quit (event):
     pygame.quit()
     sys.exit()
 
 
+def pressed_keys ():
+    """Get the set of keys currently held down, from pygame.key.get_pressed."""
+    pressed = pygame.key.get_pressed()
+    # for some reason this is faster than set(genexpr)
+    return set([i for i in xrange(len(pressed)) if pressed[i]])
+
+
+def coalesce_latest (old, new):
+    """Coalescing policy: keep only the latest event."""
+    return new
+
+
+def coalesce_motion (old, new):
+    """Coalescing policy for MOUSEMOTION: keep the latest, with rel summed."""
+    attrs = dict(new.dict)
+    attrs['rel'] = (old.rel[0] + new.rel[0], old.rel[1] + new.rel[1])
+    return pygame.event.Event(new.type, attrs)
+
+
 class EventHandler:
     """Assign callbacks to events and keypresses.
 
 EventHandler(event_handlers = {}, key_handlers = [], suppress_quit = False,
              quit_handler = evthandler.quit[, default_cbs],
-             ignore_locks = True)
+             ignore_locks = True[, coalesce])
 
 event_handlers: (event.type: callbacks) dict.
 key_handlers: list of (keys, callbacks, mode) tuples, where:
@@ -101,6 +128,11 @@ quit_handler: handler to attach to pygame.QUIT events; the default function
 default_cbs: callbacks to call for events with no registered event handlers.
 ignore_locks: whether to ignore num lock and caps lock when matching modifiers
               for key handlers with exact = True.
+coalesce: (event.type: policy) dict of event types to coalesce.  All events of
+          such a type from one call to update are merged into one, which is
+          handled in the place of the last of them.  policy is a function that
+          takes the merged event so far and the next event, and returns the new
+          merged event; see coalesce_latest and coalesce_motion.
 
 In all cases, callbacks is a list of (callback, args) tuples, where args is a
 list of arguments to pass to the callback (after any compulsory arguments).
@@ -139,6 +171,10 @@ once per frame, even if the key is pressed more than once in the last frame
 
 add_event_handlers
 add_key_handlers
+add_default_cbs
+needed_events
+filter_events
+resync
 update
 
     ATTRIBUTES
@@ -150,9 +186,24 @@ key_handlers: (keycode: data) dict of registered key handlers, where data is a
               (keycode, mods, exact) as given.
 keys_down: keys pressed between the last two calls to update.
 keys_up: keys released between the last two calls to update.
-keys_pressed: keys held down at the time of the last call to update.
-key_mods: the return value from pygame.key.get_mods at the time of the last
-          call to update.
+keys_pressed: keys held down at the time of the last call to update.  This is
+              kept up to date from key events, and only checked against
+              key_source when necessary (see resync).
+key_mods: the return value from mod_source at the time of the last call to
+          update.
+coalesce: as given (or an empty dict); may be changed.
+event_source: function that update calls to get the events to handle; defaults
+              to pygame.event.get.  Replace it to filter, record or replay
+              events.
+key_source: function that returns the set of keys held down, used on resync;
+            defaults to pressed_keys, which reads the keyboard.  When
+            event_source doesn't give live events, replace this too, so that
+            key state matches the events.
+mod_source: function that returns the key modifiers held, as a bitmask like
+            pygame.key.get_mods (the default); update calls it after getting
+            events.  Replace it along with key_source.
+poll_time: the time (from timeit.default_timer) update last got events at.
+poll_interval: the time between the last two times update got events.
 events_active: whether event handlers are called.
 keys_active: whether key handlers are called.
 defaults_active: whether default handlers are called.
@@ -161,21 +212,42 @@ defaults_active: whether default handlers are called.
 
     def __init__ (self, event_handlers = {}, key_handlers = [],
                   suppress_quit = False, quit_handler = quit,
-                  default_cbs = None, ignore_locks = True):
+                  default_cbs = None, ignore_locks = True, coalesce = None):
         self.event_handlers = {}
         self.add_event_handlers(event_handlers)
+        self._ignore_locks = ignore_locks
         self.key_handlers = {}
+        # {(key, press_type): [(cbs, key_data, mods, allowed)]}, where mods are
+        # the non-zero bitmasks that must each match and allowed is the
+        # bitmask of modifiers that may be held, or None if any may
+        self._key_table = {}
+        # {key: [(initial_delay, repeat_delay, table_entry)]}
+        self._key_repeats = {}
         self._keys_handled = [set(), set(), set(), set(), set()]
+        # unions of the above: keys with repeat, press and any down handlers
+        self._keys_repeat = set()
+        self._keys_press = set()
+        self._keys_down = set()
         self.add_key_handlers(key_handlers)
         self.default_cbs = []
         if default_cbs is not None:
             self.add_default_cbs(default_cbs)
         if not suppress_quit:
             self.add_event_handlers({pygame.QUIT: quit_handler})
-        self._ignore_locks = ignore_locks
+        self.coalesce = {} if coalesce is None else dict(coalesce)
+        self.event_source = pygame.event.get
+        self.key_source = pressed_keys
+        self.mod_source = pygame.key.get_mods
+        # whether filter_events has been called, and whether the needed events
+        # have changed since
+        self._filtering = False
+        self._filter_changed = False
+        self.poll_time = time()
+        self.poll_interval = 0
         self.keys_down = set()
         self.keys_up = set()
         self.keys_pressed = set()
+        self._resync = True
         self.key_mods = 0
         self.repeat_count = {}
         self.events_active = self.keys_active = self.defaults_active = True
@@ -193,37 +265,40 @@ defaults_active: whether default handlers are called.
             extra_args = tuple(extra_args)
             cb(*(args + extra_args))
 
-    def _call_key_cbs (self, cbs, key_data, press_type, current_mods):
-        # call key callbacks in list of accepted format if modifiers match
+    def _compile_key_data (self, cbs, key_data):
+        # build a dispatch table entry for a key handler
         if isinstance(key_data, int):
             # just got a key ID
-            key, mods, exact = (key_data, 0, False)
+            mods, exact = (0, False)
         else:
             # got (key_ID, mods, exact)
-            key, mods, exact = key_data
-        # check mods match
+            mods, exact = key_data[1:]
         if isinstance(mods, int):
             mods = (mods,)
-        mods = set(mods)
-        # check all wanted mods are currently pressed
-        match = all(mod == 0 or mod & current_mods for mod in mods)
-        if exact and match:
-            # 'subtracting' mods from current_mods gives 0 if current_mods
-            # 'contains' no other mods
-            subtract = list(mods)
+        mods = tuple(set(mod for mod in mods if mod != 0))
+        if exact:
+            allowed = reduce(int.__or__, mods, 0)
             if self._ignore_locks:
-                subtract += [pygame.KMOD_CAPS, pygame.KMOD_NUM]
-            match = current_mods & reduce(int.__or__, subtract)
-            match = (current_mods - match) == 0
-        if match:
-            self._call_cbs(cbs, key_data, press_type, current_mods)
-
-    def _call_all_cbs (self, key, press_type, modes, mods):
-        # call all callbacks for a key
-        for key_data, cb_data_sets in self.key_handlers[key].iteritems():
-            for cb_data in cb_data_sets:
-                if cb_data[1] in modes:
-                    self._call_key_cbs(cb_data[0], key_data, press_type, mods)
+                allowed |= pygame.KMOD_CAPS | pygame.KMOD_NUM
+        else:
+            allowed = None
+        return (cbs, key_data, mods, allowed)
+
+    def _call_key_cbs (self, entry, press_type, current_mods):
+        # call a dispatch table entry's callbacks if modifiers match
+        cbs, key_data, mods, allowed = entry
+        if allowed is not None and current_mods & ~allowed:
+            # other modifiers are held
+            return
+        for mod in mods:
+            if not mod & current_mods:
+                return
+        self._call_cbs(cbs, key_data, press_type, current_mods)
+
+    def _call_all_cbs (self, key, press_type, mods):
+        # call all callbacks for a key and type of key event
+        for entry in self._key_table.get((key, press_type), ()):
+            self._call_key_cbs(entry, press_type, mods)
 
     def add_event_handlers (self, event_handlers):
         """Add more event handlers.
@@ -238,6 +313,7 @@ constructor.
                 self.event_handlers[e] += cbs
             except KeyError:
                 self.event_handlers[e] = cbs
+                self._filter_changed = True
 
     def add_key_handlers (self, key_handlers):
         """Add more key handlers.
@@ -263,6 +339,27 @@ Takes a key_handlers argument in the same form as expected by the constructor.
                 else:
                     self.key_handlers[k][data].append([cbs] + [mode] + args)
                 self._keys_handled[mode].add(k)
+                # compile into dispatch tables
+                entry = self._compile_key_data(cbs, data)
+                if mode == MODE_HELD:
+                    press_types = (-1,)
+                elif mode in (MODE_ONPRESS, MODE_ONPRESS_REPEAT):
+                    press_types = (0, 1)
+                else:
+                    press_types = (0,)
+                for press_type in press_types:
+                    table = self._key_table.setdefault((k, press_type), [])
+                    table.append(entry)
+                if mode in (MODE_ONPRESS_REPEAT, MODE_ONDOWN_REPEAT):
+                    initial, repeat = args
+                    self._key_repeats.setdefault(k, []).append(
+                        (initial, repeat, entry)
+                    )
+                    self._keys_repeat.add(k)
+                if mode in (MODE_ONPRESS, MODE_ONPRESS_REPEAT):
+                    self._keys_press.add(k)
+                if mode != MODE_HELD:
+                    self._keys_down.add(k)
 
     def add_default_cbs (self, cbs):
         """Add more default event callbacks.
@@ -272,6 +369,67 @@ the constructor.
 
 """
         self.default_cbs += self._clean_cbs(cbs)
+        self._filter_changed = True
+
+    def needed_events (self):
+        """Get the event types this handler does something with.
+
+Returns a set of event types, or None if every type is needed (because there
+are default callbacks).  Key events and focus events are always needed, to keep
+track of pressed keys.
+
+"""
+        if self.default_cbs:
+            return None
+        needed = set(self.event_handlers)
+        needed.update((pygame.KEYDOWN, pygame.KEYUP))
+        needed.update(RESYNC_EVENTS)
+        return needed
+
+    def filter_events (self):
+        """Stop Pygame from queueing events that this handler doesn't need.
+
+This uses pygame.event.set_allowed and pygame.event.set_blocked, which apply to
+every event handler, so call it when this handler becomes the one in use.
+After this, update calls it again when handlers are added.
+
+"""
+        self._filtering = True
+        self._filter_changed = False
+        needed = self.needed_events()
+        if needed is None:
+            pygame.event.set_allowed(None)
+        else:
+            pygame.event.set_blocked(None)
+            pygame.event.set_allowed(list(needed))
+
+    def _coalesce (self, events):
+        # merge events of types with coalescing policies
+        coalesce = self.coalesce
+        merged = {}
+        last = {}
+        for i, event in enumerate(events):
+            t = event.type
+            if t in coalesce:
+                if t in merged:
+                    merged[t] = coalesce[t](merged[t], event)
+                else:
+                    merged[t] = event
+                last[t] = i
+        if not last:
+            return events
+        keep = dict((i, merged[t]) for t, i in last.iteritems())
+        return [keep.get(i, event) for i, event in enumerate(events)
+                if i in keep or event.type not in coalesce]
+
+    def resync (self):
+        """Get the pressed keys from key_source on the next call to update.
+
+Call this if this handler might have missed key events, such as when it hasn't
+been updated for a while.  This is done automatically on focus changes.
+
+"""
+        self._resync = True
 
     def update (self):
         """Go through the event queue and call callbacks.
@@ -286,9 +444,18 @@ Call this every frame.
         down_mods = {}
         self.keys_up = set()
         up_mods = {}
-        pressed_mods = pygame.key.get_mods()
+        pressed = self.keys_pressed
+        if self._filter_changed and self._filtering:
+            self.filter_events()
+        events = self.event_source()
+        pressed_mods = self.key_mods = self.mod_source()
+        t = time()
+        self.poll_interval = t - self.poll_time
+        self.poll_time = t
+        if self.coalesce:
+            events = self._coalesce(events)
         # call event callbacks and compile keypresses
-        for event in pygame.event.get():
+        for event in events:
             if event.type in self.event_handlers:
                 cbs = self.event_handlers[event.type]
                 # call callbacks registered for this event type
@@ -303,17 +470,22 @@ Call this every frame.
                 if event.type == pygame.KEYDOWN:
                     self.keys_down.add(event.key)
                     down_mods[event.key] = event.mod
+                    pressed.add(event.key)
                 else:
                     self.keys_up.add(event.key)
                     up_mods[event.key] = event.mod
-        pressed = pygame.key.get_pressed()
-        # form some reason this is faster than set(genexpr)
-        self.keys_pressed = set([i for i in xrange(len(pressed)) if pressed[i]])
+                    pressed.discard(event.key)
+            elif event.type in RESYNC_EVENTS:
+                self._resync = True
+        if self._resync:
+            self._resync = False
+            pressed = self.keys_pressed = set(self.key_source())
         # update repeated key counts
-        held = (self._keys_handled[2] | self._keys_handled[4]) & self.keys_pressed
-        for k in set(self.repeat_count) - held:
-            # no longer being held
-            del self.repeat_count[k]
+        held = self._keys_repeat & pressed
+        if self.repeat_count:
+            for k in set(self.repeat_count) - held:
+                # no longer being held
+                del self.repeat_count[k]
         for k in held:
             if k in self.repeat_count:
                 self.repeat_count[k] += 1
@@ -321,27 +493,19 @@ Call this every frame.
                 self.repeat_count[k] = 0
         # call key callbacks
         if keys_active:
-            for k in self._keys_handled[0] & self.keys_pressed:
-                self._call_all_cbs(k, -1, (0,), pressed_mods)
-            temp = self._keys_handled[1] | self._keys_handled[2]
-            called = set()
-            for k in (temp | self._keys_handled[3] | self._keys_handled[4]) & self.keys_down:
-                called.add(k)
-                self._call_all_cbs(k, 0, (1, 2, 3, 4), down_mods[k])
-            for k in temp & self.keys_up:
-                self._call_all_cbs(k, 1, (1, 2), up_mods[k])
+            for k in self._keys_handled[0] & pressed:
+                self._call_all_cbs(k, -1, pressed_mods)
+            called = self._keys_down & self.keys_down
+            for k in called:
+                self._call_all_cbs(k, 0, down_mods[k])
+            for k in self._keys_press & self.keys_up:
+                self._call_all_cbs(k, 1, up_mods[k])
             # keys might have callbacks with different repeat delays/rates, so
             # need to check each set of callbacks individually
+            call_key_cbs = self._call_key_cbs
             for k, count in self.repeat_count.iteritems():
                 if k in called:
                     continue
-                for key_data, cb_data in self.key_handlers[k].iteritems():
-                    for cb_datum in cb_data:
-                        try:
-                            cbs, mode, initial, repeat = cb_datum
-                        except ValueError:
-                            # a key might be used for both repeating and not
-                            # repeating modes, and both uses will end up here
-                            continue
-                        if count >= initial and (count - initial) % repeat == 0:
-                            self._call_key_cbs(cbs, key_data, 2, pressed_mods)
+                for initial, repeat, entry in self._key_repeats[k]:
+                    if count >= initial and (count - initial) % repeat == 0:
+                        call_key_cbs(entry, 2, pressed_mods)
@@ -24,6 +24,9 @@ Scheduler
 """
 
 from time import time
+from math import ceil
+from heapq import heappush, heappop, heapify
+from collections import deque
 
 try:
     from pygame.time import wait
@@ -42,9 +45,11 @@ what you need to.
 
     CONSTRUCTOR
 
-Timer(fps = 60)
+Timer(fps = 60, throttle = True)
 
 fps: frames per second to aim for.
+throttle: whether to wait between frames; if False, frames run as fast as
+          possible (but fps is still used to convert times to frames).
 
     METHODS
 
@@ -52,23 +57,106 @@ run
 step
 stop
 set_fps
+set_draw_fps
+reset_lateness
+lateness
 
     ATTRIBUTES
 
 fps: the current target FPS.  Use the set_fps method to change it.
 frame: the current length of a frame in seconds.
+draw_fps: the maximum rate to call the draw function passed to run at, or None
+          to call it after every batch of frames.  Use the set_draw_fps method
+          to change it.
+max_frames: the maximum number of frames to run in a row to catch up when
+            behind, before drawing; after this, the missed time is dropped.
 t: the time at the last step, if using individual steps.
+throttle: as given; may be changed at any time.
+spin: the time in seconds before a frame is due to stop sleeping and instead
+      spin (check the time repeatedly) until it is due.  Sleeping is only
+      accurate to a millisecond or so, so this trades CPU time for accurate
+      frame timing; 0 (the default) never spins.
+late_hist: a histogram of how late frames start, when throttled: a list of
+           counts, where item i counts frames between i * late_bucket and
+           (i + 1) * late_bucket seconds late, and the last item also counts
+           anything later.
+late_bucket: the width of buckets in late_hist, in seconds; call
+             reset_lateness after changing this.
+late_total: the total lateness of all frames recorded in late_hist, in seconds.
+            Since frames are scheduled at fixed times, this doesn't include
+            drift: lateness doesn't accumulate over frames.
 
 """
 
-    def __init__ (self, fps = 60):
+    def __init__ (self, fps = 60, throttle = True):
         self.set_fps(fps)
+        self.set_draw_fps(None)
+        self.max_frames = 5
+        self.throttle = throttle
+        self.spin = 0
+        self.late_bucket = .0005
+        self.reset_lateness()
         self.t = time()
 
-    def run (self, cb, args = (), frames = None, seconds = None):
+    def reset_lateness (self, n_buckets = 40):
+        """Clear lateness statistics, with the given number of buckets."""
+        self.late_hist = [0] * n_buckets
+        self.late_total = 0.
+        self._late_max = 0.
+
+    def _record_late (self, late):
+        late = max(late, 0)
+        hist = self.late_hist
+        hist[min(int(late / self.late_bucket), len(hist) - 1)] += 1
+        self.late_total += late
+        if late > self._late_max:
+            self._late_max = late
+
+    def lateness (self):
+        """Get statistics for how late frames have started.
+
+lateness() -> stats
+
+stats: a dict with keys 'frames' (the number of frames recorded), 'mean', 'max',
+       'p50', 'p95' and 'p99', with times in seconds.  Percentiles are the upper
+       edges of late_hist buckets, so only accurate to late_bucket.
+
+"""
+        hist = self.late_hist
+        n = sum(hist)
+        stats = {'frames': n, 'mean': self.late_total / n if n else 0,
+                 'max': self._late_max}
+        for p in (50, 95, 99):
+            # nearest rank
+            rank = -(-p * n // 100)
+            seen = 0
+            for i, count in enumerate(hist):
+                seen += count
+                if seen >= rank:
+                    break
+            stats['p{0}'.format(p)] = min((i + 1) * self.late_bucket,
+                                          self._late_max) if n else 0
+        return stats
+
+    def _wait_until (self, t):
+        """Wait until the given time (as returned by time.time)."""
+        spin = self.spin
+        dt = t - time()
+        if spin:
+            if dt > spin:
+                # wakes up to a millisecond early, which we spin for anyway
+                wait(int(1000 * (dt - spin)))
+            while time() < t:
+                pass
+        elif dt > 0:
+            # round up, so we don't wake up early
+            wait(int(ceil(1000 * dt)))
+
+    def run (self, cb, args = (), frames = None, seconds = None, draw = None,
+             idle = None):
         """Run indefinitely or for a specified amount of time.
 
-run(cb[, args][, frames][, seconds])
+run(cb[, args][, frames][, seconds][, draw][, idle])
 
 cb: a function to call every frame.
 args: list of arguments to pass to cb.
@@ -76,6 +164,18 @@ frames: number of frames to run for.
 seconds: number of seconds to run for; this can be a float, and is not wrapped
          to an integer number of frames: we wait for the remainder at the
          start.  If passed, frames is ignored.
+draw: a function to call after frames are run, at most draw_fps times per
+      second.  It takes the fraction of a frame that has passed since the last
+      frame was due, 0 <= fraction <= 1, for interpolating between frames.
+idle: a function to call with any time left over before waiting for the next
+      frame or draw.  It takes the time (as returned by time.time) by which it
+      should return.  If not throttled, it is called after every frame (and
+      draw) with None, and should do a small, fixed amount of work.
+
+Frames are run at a fixed rate: if we fall behind, frames are run in a row
+(without drawing in between) to catch up, so the number of frames run keeps up
+with the time passed.  If not throttled, each frame is followed by a draw with
+a fraction of 1.
 
 """
         self.stopped = False
@@ -83,38 +183,69 @@ seconds: number of seconds to run for; this can be a float, and is not wrapped
         if seconds is not None:
             frames = int(seconds / frame)
             # wait for remainder
-            wait(int(1000 * (frames * frame - seconds)))
+            if self.throttle:
+                wait(int(1000 * (frames * frame - seconds)))
         finite = frames is not None
         if finite:
             frames = max(int(frames), 1)
-        # main loop
-        t0 = time()
-        while not finite or frames:
-            cb(*args)
-            if self.stopped:
-                break
+        # main loop: t_frame and t_draw are when the next frame and draw are due
+        t_frame = t_draw = time()
+        while True:
+            # run frames that are due
+            n = 0
             t = time()
-            dt = t0 + frame - t
-            if dt > 0:
-                wait(int(1000 * dt))
-                t0 = t + dt
-            else:
-                t0 = t
-            if finite:
-                frames -= 1
-                if frames == 0:
+            while t >= t_frame or not self.throttle:
+                if self.throttle:
+                    self._record_late(t - t_frame)
+                cb(*args)
+                n += 1
+                t_frame += self.frame
+                if finite:
+                    frames -= 1
+                if self.stopped or frames == 0 or not self.throttle:
                     break
-                assert frames > 0
+                t = time()
+                if n == self.max_frames and t >= t_frame:
+                    # too far behind: drop the missed time
+                    t_frame = t
+                    break
+            if self.stopped:
+                break
+            # draw
+            if draw is not None:
+                t = time()
+                if not self.throttle:
+                    draw(1)
+                elif t >= t_draw and (n or self.draw_frame is not None):
+                    r = 1 - (t_frame - t) / self.frame
+                    draw(min(max(r, 0), 1))
+                    if self.draw_frame is not None:
+                        t_draw = max(t_draw + self.draw_frame, t)
+            if self.stopped or frames == 0:
+                break
+            # wait for the next frame or draw
+            if self.throttle:
+                if draw is None or self.draw_frame is None:
+                    t_next = t_frame
+                else:
+                    t_next = min(t_frame, t_draw)
+                if idle is not None and time() < t_next - self.spin:
+                    idle(t_next - self.spin)
+                self._wait_until(t_next)
+            elif idle is not None:
+                idle(None)
 
     def step (self):
         """Step forwards one frame."""
-        t = time()
-        dt = self.t + self.frame - t
-        if dt > 0:
-            wait(int(1000 * dt))
-            self.t = t + dt
+        due = self.t + self.frame
+        if self.throttle:
+            self._wait_until(due)
+            t = time()
+            self._record_late(t - due)
         else:
-            self.t = t
+            t = time()
+        # keep to the schedule unless we're more than a frame behind
+        self.t = due if t - due < self.frame else t
 
     def stop (self):
         """Stop any current call to Timer.run."""
@@ -128,32 +259,73 @@ seconds: number of seconds to run for; this can be a float, and is not wrapped
         self.fps = int(round(fps))
         self.frame = 1. / fps
 
+    def set_draw_fps (self, fps):
+        """Set the maximum draw rate (None for no limit)."""
+        self.draw_fps = fps
+        self.draw_frame = None if fps is None else 1. / fps
+
 
 class Scheduler ():
     """Simple event scheduler.
 
     CONSTRUCTOR
 
-Scheduler(fps = 60)
+Scheduler(fps = 60, throttle = True)
 
-fps: frames per second to aim for.
+fps, throttle: as taken by Timer.
 
     METHODS
 
 run
 add_timeout
 rm_timeout
+add_task
+rm_task
+profile_report
+dump_profile
 
     ATTRIBUTES
 
 timer: Timer instance.  Use this to change the FPS or stop the scheduler.
+draw: a function to pass to Timer.run as its draw argument, or None.  Timeouts
+      are handled in frames, which run at a fixed rate, and this is called in
+      between.
+after_frame: a function to call with no arguments after each frame's timeouts
+             have been handled, or None.
+t: the time passed in seconds, as the sum of the lengths of frames run so far.
+   Since frames run on a fixed schedule, this keeps up with real time when
+   throttled, and is unaffected by changes to the timer's FPS.
+profile: whether to time timeout callbacks; may be changed at any time.  See
+         profile_report.
+slow_share: when profiling, callbacks that take longer than this fraction of
+            a frame are recorded in slow_calls.
+slow_calls: a deque of the most recent (up to 1000) slow callback calls, each
+            (frame, ID, name, time), with time in seconds.
 
 """
 
-    def __init__ (self, fps = 60):
-        self.timer = Timer(fps)
+    def __init__ (self, fps = 60, throttle = True):
+        self.timer = Timer(fps, throttle)
+        self.draw = None
+        self.after_frame = None
+        self.t = 0
+        # {ID: [due, due in seconds, repeat, repeat in seconds, cb, args]},
+        # where due is a frame number or a time (Scheduler.t)
         self._cbs = {}
+        # (due, ID) heaps for frame- and seconds-based timeouts; may contain
+        # stale entries for removed timeouts, which are skipped
+        self._due = []
+        self._due_t = []
+        self._frame = 0
         self._max_id = 0
+        # {ID: task}, and IDs in the order tasks will be advanced
+        self._tasks = {}
+        self._task_order = []
+        self.profile = False
+        self.slow_share = .5
+        self.slow_calls = deque(maxlen = 1000)
+        # {name: [calls, total time, max time, last ID]}
+        self._profile = {}
 
     def run (self, frames = None, seconds = None):
         """Start the scheduler.
@@ -163,7 +335,8 @@ run([frames][, seconds])
 Arguments are as required by Timer.run.
 
 """
-        self.timer.run(self._update, (), frames, seconds)
+        self.timer.run(self._update, (), frames, seconds, self.draw,
+                       self._run_tasks)
 
     def add_timeout (self, cb, args = (), frames = None, seconds = None,
                      repeat_frames = None, repeat_seconds = None):
@@ -175,33 +348,50 @@ add_timeout(cb[, args][, frames][, seconds][, repeat_frames][, repeat_seconds])
 cb: the function to call.
 args: list of arguments to pass to cb.
 frames: number of frames to wait before calling.
-seconds: number of seconds to wait before calling; this can be a float, and is
-         wrapped to an integer number of frames.  If passed, frames is
-         ignored.
+seconds: number of seconds to wait before calling; this can be a float.  The
+         function is called in the first frame at which this much time has
+         passed (see Scheduler.t), regardless of any changes to the FPS in the
+         meantime.  If passed, frames is ignored.
 repeat_frames: number of frames to wait between calls.
 repeat_seconds: number of seconds to wait between calls; can be a float like
-                seconds.  If passed, repeat_frames is ignored; if neither
+                seconds.  Calls are spaced from the time each was due, so they
+                don't drift.  If passed, repeat_frames is ignored; if neither
                 repeat_frames or repeat_seconds is passed, the initial time
                 delay is used between calls.
 
 ID: an ID to pass to rm_timeout.  This is guaranteed to be unique over time.
 
 The called function can return a boolean True object to repeat the timeout;
-otherwise it is removed.
+otherwise it is removed.  Timeouts due in the same frame are called in the
+order they were added.
 
 """
         if seconds is not None:
-            frames = seconds * self.timer.fps
-        frames = max(int(frames), 1)
+            delay = max(seconds, 0)
+        else:
+            delay = max(int(frames), 1)
         if repeat_seconds is not None:
-            repeat_frames = repeat_seconds * self.timer.fps
-        elif repeat_frames is None:
-            repeat_frames = frames
-        repeat_frames = max(int(repeat_frames), 1)
-        self._cbs[self._max_id] = [frames, repeat_frames, cb, args]
+            repeat = max(repeat_seconds, 0)
+            repeat_s = True
+        elif repeat_frames is not None:
+            repeat = max(int(repeat_frames), 1)
+            repeat_s = False
+        else:
+            repeat = delay
+            repeat_s = seconds is not None
+        i = self._max_id
+        if seconds is not None:
+            data = [self.t + delay, True, repeat, repeat_s, cb, args]
+        else:
+            data = [self._frame + delay, False, repeat, repeat_s, cb, args]
+        self._cbs[i] = data
+        self._push(i, data)
         self._max_id += 1
         # ID is key in self._cbs
-        return self._max_id - 1
+        return i
+
+    def _push (self, i, data):
+        heappush(self._due_t if data[1] else self._due, (data[0], i))
 
     def rm_timeout (self, *ids):
         """Remove the timeouts with the given IDs."""
@@ -210,21 +400,176 @@ otherwise it is removed.
                 del self._cbs[i]
             except KeyError:
                 pass
+        # drop stale heap entries if they're most of the heaps
+        if len(self._due) + len(self._due_t) > 2 * len(self._cbs) + 64:
+            self._due = []
+            self._due_t = []
+            for i, data in self._cbs.iteritems():
+                (self._due_t if data[1] else self._due).append((data[0], i))
+            heapify(self._due)
+            heapify(self._due_t)
+
+    def add_task (self, task):
+        """Run a task in the time left over between frames.
+
+add_task(task) -> ID
+
+task: an iterator, usually a generator, that does a little work each time it is
+      advanced; it should yield often.  It should yield a true value if it did
+      some work, or a false value if it's waiting for something.  It is
+      removed when it is exhausted.
+
+ID: an ID to pass to rm_task.  IDs are unique over time, and never the same as
+    a timeout ID.
+
+Tasks are advanced in turn, as many times as fit in the time before the next
+frame is due, so they never delay frames by more than one step; we stop early
+if every task is waiting.  If frames aren't throttled, each task is advanced
+once per frame.  Blocking I/O should be
+done on another thread, with a task polling for the result.
+
+"""
+        i = self._max_id
+        self._max_id += 1
+        self._tasks[i] = iter(task)
+        self._task_order.append(i)
+        return i
+
+    def rm_task (self, *ids):
+        """Remove the tasks with the given IDs."""
+        for i in ids:
+            try:
+                del self._tasks[i]
+            except KeyError:
+                pass
+
+    def _run_tasks (self, end):
+        """Advance tasks until the given time (see Timer.run's idle)."""
+        tasks = self._tasks
+        order = self._task_order
+        # n is the number of tasks to advance before checking whether any did
+        # any work; if not throttled, we stop then
+        n = len(order)
+        working = False
+        while order and (end is None or time() < end):
+            if n == 0:
+                if end is None or not working:
+                    break
+                n = len(order)
+                working = False
+            n -= 1
+            i = order.pop(0)
+            task = tasks.get(i)
+            if task is None:
+                # removed
+                continue
+            try:
+                working |= bool(task.next())
+            except StopIteration:
+                tasks.pop(i, None)
+                continue
+            if i in tasks:
+                # move to the back, so every task gets a turn
+                order.append(i)
 
     def _update (self):
         """Handle callbacks this frame."""
-        rm = []
-        # cbs might add/remove cbs, so use items instead of iteritems
-        for i, (remain, total, cb, args) in self._cbs.items():
-            remain -= 1
-            if remain == 0:
-                # call callback
-                if cb(*args):
-                    self._cbs[i][0] = total
-                else:
-                    rm.append(i)
+        self._frame = frame = self._frame + 1
+        self.t = t = self.t + self.timer.frame
+        cbs = self._cbs
+        # get timeouts that are due; only look at those, and get them all
+        # first, since callbacks might add or repeat timeouts
+        todo = []
+        # allow for error from summing frame lengths
+        for due, now in ((self._due, frame), (self._due_t, t + 10 ** -9)):
+            while due and due[0][0] <= now:
+                d, i = heappop(due)
+                data = cbs.get(i)
+                if data is not None and data[0] == d:
+                    todo.append(i)
+        if len(todo) > 1:
+            todo.sort()
+        for i in todo:
+            data = cbs.get(i)
+            if data is None:
+                # removed by an earlier callback
+                continue
+            if self.profile:
+                t0 = time()
+                repeat = data[4](*data[5])
+                self._record(i, data[4], time() - t0)
+            else:
+                repeat = data[4](*data[5])
+            if repeat:
+                # repeat, unless the callback removed itself
+                if cbs.get(i) is data:
+                    if data[3]:
+                        data[0] = (data[0] if data[1] else t) + data[2]
+                    else:
+                        data[0] = frame + data[2]
+                    data[1] = data[3]
+                    self._push(i, data)
             else:
-                assert remain > 0
-                self._cbs[i][0] = remain
-        for i in rm:
-            del self._cbs[i]
+                cbs.pop(i, None)
+        if self.after_frame is not None:
+            self.after_frame()
+
+    def _record (self, i, cb, t):
+        """Record the time taken by a timeout callback."""
+        name = _cb_name(cb)
+        stats = self._profile.get(name)
+        if stats is None:
+            self._profile[name] = [1, t, t, i]
+        else:
+            stats[0] += 1
+            stats[1] += t
+            if t > stats[2]:
+                stats[2] = t
+            stats[3] = i
+        if t > self.slow_share * self.timer.frame:
+            self.slow_calls.append((self._frame, i, name, t))
+
+    def profile_report (self):
+        """Get timings for callbacks recorded while profiling.
+
+profile_report() -> report
+
+report: a list of (ID, name, calls, total, max) tuples, most total time first,
+        where name is the callback's qualified name and times are in seconds.
+        Calls are totalled by name, over every timeout with that callback
+        (such as one-shot timeouts added again and again), and ID is the
+        last of those timeouts to be called.
+
+"""
+        report = [(i, name, n, total, t_max)
+                  for name, (n, total, t_max, i) in self._profile.iteritems()]
+        report.sort(key = lambda r: r[3], reverse = True)
+        return report
+
+    def dump_profile (self, fn):
+        """Write the profile report and slow callback calls to a file."""
+        with open(fn, 'w') as f:
+            f.write('last_id name calls total_ms mean_ms max_ms\n')
+            for i, name, n, total, t_max in self.profile_report():
+                f.write('{0} {1} {2} {3:.3f} {4:.3f} {5:.3f}\n'.format(
+                    i, name, n, 1000 * total, 1000 * total / n, 1000 * t_max
+                ))
+            f.write('\nslow calls: frame id name ms\n')
+            for frame, i, name, t in self.slow_calls:
+                f.write('{0} {1} {2} {3:.3f}\n'.format(frame, i, name,
+                                                       1000 * t))
+
+
+def _cb_name (cb):
+    """Get a qualified name for a callback."""
+    if hasattr(cb, 'im_func'):
+        # method
+        cls = cb.im_class if cb.im_self is None else type(cb.im_self)
+        return '{0}.{1}.{2}'.format(cls.__module__, cls.__name__, cb.__name__)
+    code = getattr(cb, 'func_code', None)
+    if code is not None:
+        name = '{0}.{1}'.format(getattr(cb, '__module__', None), cb.__name__)
+        if cb.__name__ == '<lambda>':
+            name += ':{0}'.format(code.co_firstlineno)
+        return name
+    return repr(cb)
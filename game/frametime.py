@@ -0,0 +1,132 @@
+from array import array
+from timeit import default_timer as time
+
+
+def percentile (sorted_values, p):
+    """Get a percentile of a sorted list by the nearest-rank method.
+
+percentile(sorted_values, p) -> value
+
+p: the percentile, 0 < p <= 100.
+
+"""
+    if not sorted_values:
+        return 0
+    n = len(sorted_values)
+    i = int(-(-p * n // 100)) - 1
+    return sorted_values[min(max(i, 0), n - 1)]
+
+
+class FrameTimer (object):
+    """Record how long each phase of a frame takes.
+
+    CONSTRUCTOR
+
+FrameTimer(phases, size = 600)
+
+phases: a list of names of phases.
+size: the number of frames to remember; older frames are overwritten.
+
+Call start at the start of each frame, mark at the end of each phase and end at
+the end of the frame.  Phases may be marked any number of times per frame (the
+times are summed), or not at all.  The time for the whole frame is recorded
+under the extra phase 'total'; this excludes time passed to skip.
+
+    METHODS
+
+start
+mark
+skip
+end
+last
+times
+summary
+dump
+
+    ATTRIBUTES
+
+phases: as given, plus 'total'.
+size: as given.
+n: the number of frames currently stored.
+
+"""
+
+    def __init__ (self, phases, size = 600):
+        self.phases = list(phases) + ['total']
+        self.size = size
+        self.n = 0
+        self._i = 0
+        self._times = dict((p, array('d', [0.]) * size) for p in self.phases)
+        self._current = dict.fromkeys(phases, 0.)
+        self._t0 = self._t = time()
+        self._skipped = 0.
+
+    def start (self):
+        """Start timing a frame."""
+        current = self._current
+        for p in current:
+            current[p] = 0.
+        self._skipped = 0.
+        self._t0 = self._t = time()
+
+    def mark (self, phase):
+        """Attribute the time since the last mark (or start) to a phase."""
+        t = time()
+        self._current[phase] += t - self._t
+        self._t = t
+
+    def skip (self):
+        """Don't count the time since the last mark (or start) at all."""
+        t = time()
+        self._skipped += t - self._t
+        self._t = t
+
+    def end (self):
+        """Finish timing a frame and store the results."""
+        t = time()
+        i = self._i
+        times = self._times
+        for p, dt in self._current.iteritems():
+            times[p][i] = dt
+        times['total'][i] = t - self._t0 - self._skipped
+        self._i = (i + 1) % self.size
+        self.n = min(self.n + 1, self.size)
+
+    def last (self, phase = 'total'):
+        """Get the time for a phase in the most recently stored frame."""
+        return self._times[phase][self._i - 1] if self.n else 0
+
+    def times (self, phase):
+        """Get a list of stored times for a phase, in seconds, oldest first."""
+        ts = self._times[phase]
+        if self.n < self.size:
+            return ts[:self.n].tolist()
+        i = self._i
+        return (ts[i:] + ts[:i]).tolist()
+
+    def summary (self):
+        """Get statistics for stored frames.
+
+Returns a {phase: stats} dict, where stats is a dict with keys 'p50', 'p95',
+'p99' and 'max', giving times in seconds.
+
+"""
+        rtn = {}
+        for p in self.phases:
+            ts = sorted(self.times(p))
+            rtn[p] = {'p50': percentile(ts, 50), 'p95': percentile(ts, 95),
+                      'p99': percentile(ts, 99), 'max': ts[-1] if ts else 0}
+        return rtn
+
+    def dump (self, fn):
+        """Write stored times to a file.
+
+The file has a header line of phase names, then a line for each frame, oldest
+first, of space-separated times in seconds.
+
+"""
+        cols = [self.times(p) for p in self.phases]
+        with open(fn, 'w') as f:
+            f.write(' '.join(self.phases) + '\n')
+            for row in zip(*cols):
+                f.write(' '.join('{0:.6f}'.format(t) for t in row) + '\n')
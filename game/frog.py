@@ -73,7 +73,12 @@ class Frog (obj_module.OneTileObj):
 
     def _move (self, dest):
         self._face(dest)
+        sx, sy = conf.TILE_SIZE
+        # the frog is redrawn on the tiles it moves between
+        rect = pg.Rect(self.pos[0] * sx, self.pos[1] * sy, sx, sy)
+        rect.union_ip((dest[0] * sx, dest[1] * sy, sx, sy))
         self.pos = dest
+        self.level.game.latency.respond(rect)
         return ir(conf.FROG_MOVE_TIME * self.level.game.scheduler.timer.fps)
 
     def get_path (self, dest, extra_objs = ()):
@@ -260,6 +265,7 @@ class Frog (obj_module.OneTileObj):
             else:
                 # nothing to do
                 if on_fail:
+                    self.level.game.latency.kind('fail')
                     self.level.say(on_fail[0])
                     return
             if action == 'inspect':
@@ -295,6 +301,7 @@ class Frog (obj_module.OneTileObj):
                     on_fail.append(msg.format(obj_module.name(self.item)))
                 else:
                     break
+        self.level.game.latency.kind(action)
         if action == 'move':
             self.move(pos)
         elif action in ('inspect', 'grab', 'drop', 'use'):
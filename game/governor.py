@@ -0,0 +1,83 @@
+class Governor (object):
+    """Choose a frame rate from tiers based on how long frames take.
+
+    CONSTRUCTOR
+
+Governor(tiers, window = 60, miss = .2, headroom = .6)
+
+tiers: a list of frame rates to choose from, highest first.  We start at the
+       highest.
+window: the number of frames to look at before deciding whether to change tier.
+miss: step down a tier if more than this fraction of frames in a window take
+      longer than the current tier's budget (1 / fps).
+headroom: step up a tier if no more than the fraction miss of the frames in a
+          window take longer than this fraction of the higher tier's budget.
+
+    METHODS
+
+add
+reset
+
+    ATTRIBUTES
+
+tiers: as given.
+tier: the index of the current tier in tiers.
+fps: the current frame rate.
+n: the number of frames added.
+history: a list of (n, fps) tuples for each time the tier changed, where n is
+         the number of frames added at the time.
+
+"""
+
+    def __init__ (self, tiers, window = 60, miss = .2, headroom = .6):
+        self.tiers = list(tiers)
+        self.window = window
+        self.miss = miss
+        self.headroom = headroom
+        self.history = []
+        self.n = 0
+        self.reset()
+
+    def reset (self, tier = 0):
+        """Go to the given tier (index) and start a new window."""
+        self.tier = tier
+        self.fps = self.tiers[tier]
+        self._budget = 1. / self.fps
+        if tier > 0:
+            self._up_budget = self.headroom / self.tiers[tier - 1]
+        else:
+            self._up_budget = None
+        self._start_window()
+
+    def _start_window (self):
+        self._frames = 0
+        self._misses = 0
+        # frames that wouldn't fit in the higher tier
+        self._up_misses = 0
+
+    def add (self, t):
+        """Record a frame's duration, in seconds.
+
+Returns the new frame rate if the tier changed, else None.
+
+"""
+        self.n += 1
+        self._frames += 1
+        if t > self._budget:
+            self._misses += 1
+        if self._up_budget is not None and t > self._up_budget:
+            self._up_misses += 1
+        if self._frames < self.window:
+            return None
+        tier = self.tier
+        allowed = self.miss * self._frames
+        if self._misses > allowed:
+            tier = min(tier + 1, len(self.tiers) - 1)
+        elif tier > 0 and self._up_misses <= allowed:
+            tier -= 1
+        if tier == self.tier:
+            self._start_window()
+            return None
+        self.reset(tier)
+        self.history.append((self.n, self.fps))
+        return self.fps
@@ -0,0 +1,126 @@
+from collections import deque
+from timeit import default_timer as time
+
+from frametime import percentile
+
+
+class LatencyTracker (object):
+    """Measure the time from input to the first frame that shows a response.
+
+    CONSTRUCTOR
+
+LatencyTracker(size = 200)
+
+size: the number of latencies to remember for each kind of input.
+
+Call input when an input is handled, then kind to say what kind of input it is
+(such as the action it caused).  Call respond when the game changes in a way
+that's visible in response to the input, with the area of the screen that
+shows it, and presented after each frame that updates the display, with the
+areas updated.  A response is only counted as presented by a frame that
+updates its area, so unrelated updates (such as the timing HUD) don't cut
+latencies short.  Only the latest input is followed: if another input is
+handled before the last gets a response, the last is counted as unanswered.
+
+Times are taken from timeit.default_timer.
+
+    METHODS
+
+input
+kind
+respond
+presented
+summary
+
+    ATTRIBUTES
+
+size: as given.
+unanswered: {kind: count} dict of inputs that never got a response.
+
+"""
+
+    def __init__ (self, size = 200):
+        self.size = size
+        self.unanswered = {}
+        # {kind: deque of (latency, queued)}
+        self._samples = {}
+        # [kind, t, queued], or None
+        self._pending = None
+        # [(kind, t, queued, rect)] for responses not yet presented
+        self._responded = []
+
+    def input (self, t, queued = 0):
+        """Start following an input.
+
+input(t, queued = 0)
+
+t: the time the input's event was taken from the event queue.
+queued: the most time the event could have waited in the queue before that
+        (such as the time since the queue was last checked).
+
+"""
+        p = self._pending
+        if p is not None and p[0] is not None:
+            self.unanswered[p[0]] = self.unanswered.get(p[0], 0) + 1
+        self._pending = [None, t, queued]
+
+    def kind (self, kind):
+        """Set the kind of the input being followed."""
+        if self._pending is not None:
+            self._pending[0] = kind
+
+    def respond (self, rect = None):
+        """Note that the game has responded to the input being followed.
+
+respond([rect])
+
+rect: the area of the screen that shows the response, as a pygame.Rect; if not
+      given, any frame presented shows it.
+
+"""
+        p = self._pending
+        if p is not None and p[0] is not None:
+            self._responded.append(tuple(p) + (rect,))
+            self._pending = None
+
+    def presented (self, rects = True):
+        """Note that a frame was just put on the display.
+
+presented(rects = True)
+
+rects: a list of the pygame.Rect areas of the display that were updated, or
+       True if all of it was.
+
+"""
+        if self._responded:
+            t = time()
+            samples = self._samples
+            waiting = []
+            for r in self._responded:
+                kind, t0, queued, rect = r
+                if not (rects is True or rect is None or
+                        rect.collidelist(rects) != -1):
+                    waiting.append(r)
+                    continue
+                if kind not in samples:
+                    samples[kind] = deque(maxlen = self.size)
+                samples[kind].append((t - t0, queued))
+            self._responded = waiting
+
+    def summary (self):
+        """Get statistics for remembered latencies.
+
+Returns a {kind: stats} dict, where stats is a dict with keys 'n' (the number
+of latencies), 'p50', 'p95', 'p99' and 'max' (latencies in seconds, from the
+time passed to input until the frame was presented), and 'queued' (the median
+of the queued values passed to input, in seconds).
+
+"""
+        rtn = {}
+        for kind, samples in self._samples.iteritems():
+            ts = sorted(t for t, queued in samples)
+            qs = sorted(queued for t, queued in samples)
+            rtn[kind] = {'n': len(ts), 'p50': percentile(ts, 50),
+                         'p95': percentile(ts, 95), 'p99': percentile(ts, 99),
+                         'max': ts[-1], 'queued': percentile(qs, 50)}
+        return rtn
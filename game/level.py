@@ -7,7 +7,7 @@ from conf import conf
 from util import dd
 import obj as obj_module
 from frog import Frog
-from road import Road
+from road import Road, car_img_files
 import circuit
 
 TILE_SIZE = conf.TILE_SIZE
@@ -87,13 +87,20 @@ class Level (object):
         self.init()
 
     def init (self):
+        # tiles to redraw on the screen, and rects to update
         self._changed = set()
         self._changed_rects = []
+        # static layer: background and objects, with tiles to redraw
+        self._static = None
+        self._static_changed = set()
         self.overlays = []
         self.ui = {}
+        # object the label is showing
+        self._hovered = None
         self.dirty = True
         if self.ident != self._last_ident:
-            self.game.clear_caches()
+            self.game.unpin_caches()
+        self.game.img('bg.png', pin = True)
         data = conf.LEVELS[self.ident]
         sx, sy = LEVEL_SIZE
         self.objs = objs = [[[] for j in xrange(sx)] for i in xrange(sy)]
@@ -106,7 +113,21 @@ class Level (object):
                                     for obj in os]
         self.update_held()
 
+    @classmethod
+    def img_files (cls, ident):
+        # images the level with the given ident uses
+        fns = set(['bg.png', ('obj', 'deadfrog.png')])
+        fns.update(obj_module.img_files(Frog))
+        fns.update(car_img_files())
+        for os in conf.LEVELS[ident]['objs'].itervalues():
+            if isinstance(os, basestring):
+                os = (os,)
+            for obj in os:
+                fns.update(obj_module.img_files(getattr(obj_module, obj)))
+        return fns
+
     def restart (self):
+        self.game.preload(self.img_files(self.ident))
         self.cutscene(self.init, *conf.RESTART)
 
     def end (self, *args):
@@ -115,6 +136,8 @@ class Level (object):
     def _progress (self):
         if hasattr(self, '_cleanup'):
             self._cleanup()
+        # let this level's assets be evicted as the next level's are loaded
+        self.game.unpin_caches()
         self.game.switch_backend(level_backends[self.ident], self.ident)
 
     def progress (self):
@@ -122,6 +145,7 @@ class Level (object):
         if self.ident >= len(conf.LEVELS):
             self.end()
         else:
+            self.game.preload(level_backends[self.ident].img_files(self.ident))
             self.cutscene(self._progress, *conf.PROGRESS)
 
     def _end_cutscene (self):
@@ -140,6 +164,8 @@ class Level (object):
         if self._locked:
             return
         if self._grab_click(evt) and evt.button in conf.ACTION_SETS:
+            h = self.event_handler
+            self.game.latency.input(h.poll_time, h.poll_interval)
             self._rm_ui('msg')
             pos = tuple(x / s for x, s in zip(evt.pos, TILE_SIZE))
             self.frog.action(conf.ACTION_SETS[evt.button],
@@ -152,20 +178,31 @@ class Level (object):
             y = orig_y / TILE_SIZE[1]
             obj = self.top_obj(self.objs[x][y])
             if obj is None:
+                self._hovered = None
                 self._rm_ui('label')
                 return
-            label = obj_module.name(obj)
-            sfc = self.game.render_text(
-                'label', label, conf.FONT_COLOUR, bg = conf.UI_BG,
-                pad = conf.LABEL_PADDING, cache = ('label', label)
-            )[0]
+            overlay = self.ui.get('label')
+            if obj is self._hovered and overlay is not None:
+                # same label: just follow the mouse
+                sfc = overlay.sfc
+            else:
+                label = obj_module.name(obj)
+                sfc = self.game.render_text(
+                    'label', label, conf.FONT_COLOUR, bg = conf.UI_BG,
+                    pad = conf.LABEL_PADDING, cache = ('label', label)
+                )[0]
+                overlay = None
             o = conf.LABEL_OFFSET
             ws, hs = sfc.get_size()
             x, y = orig_x + o[0], orig_y - hs + o[1]
             w, h = conf.RES
             x = min(max(x, 0), w - ws)
             y = min(max(y, 0), h - hs)
-            self._add_ui('label', sfc, (x, y))
+            if overlay is None:
+                self._hovered = obj
+                self._add_ui('label', sfc, (x, y))
+            elif (x, y) != overlay.rect.topleft:
+                overlay.move(x - overlay.rect[0], y - overlay.rect[1])
 
     def _native_click (self, evt):
         return True
@@ -182,7 +219,12 @@ class Level (object):
         self._grab_move = self._native_move
 
     def change_tile (self, tile):
-        self._changed.add(tuple(tile))
+        # everything will be redrawn anyway, and draw might not be called for
+        # a while
+        if not self.dirty:
+            tile = tuple(tile)
+            self._changed.add(tile)
+            self._static_changed.add(tile)
 
     def rect_tiles (self, rect):
         sx, sy = TILE_SIZE
@@ -203,8 +245,9 @@ class Level (object):
     def change_rect (self, rect, tiles = None):
         if tiles is None:
             tiles = self.rect_tiles(rect)
-        self._changed.update(tiles)
-        self._changed_rects.append(rect)
+        if not self.dirty:
+            self._changed.update(tiles)
+            self._changed_rects.append(rect)
         return tiles
 
     def add_obj (self, obj, pos):
@@ -263,6 +306,7 @@ class Level (object):
             sfc = sfc.copy()
             self.frog.item.draw(sfc, (0, 0))
         self._add_ui('held', sfc)
+        self.game.latency.respond(self.ui['held'].rect)
 
     def say (self, msg):
         sfc = self.game.render_text(
@@ -270,11 +314,11 @@ class Level (object):
             bg = conf.UI_BG, pad = conf.MSG_PADDING, cache = ('msg', msg)
         )[0]
         self._add_ui('msg', sfc)
+        self.game.latency.respond(self.ui['msg'].rect)
 
     def update (self):
         self.frog.update()
         self.road.update()
-        self._changed.update(self.road.tiles)
 
     def _draw_objs (self, screen, objs):
         last = None
@@ -290,24 +334,38 @@ class Level (object):
             last.draw(screen)
 
     def _draw_cars (self, screen):
+        interp = self.game.interp
         for dirn, cars in self.road.cars:
             for car in cars:
-                car.draw(screen)
+                car.draw(screen, interp)
+
+    def _draw_static (self, bg, tile):
+        # redraw a tile of the static layer
+        sfc = self._static
+        x, y = tile
+        sx, sy = TILE_SIZE
+        r = (x * sx, y * sy, sx, sy)
+        sfc.blit(bg, r, r)
+        self._draw_objs(sfc, self.objs[x][y])
 
     def draw (self, screen):
+        # layers: static (background and objects, cached), cars, overlays
         bg = self.game.img('bg.png')
         draw_objs = self._draw_objs
         overlays = self.overlays
         road = self.road
+        static = self._static
         if self.dirty:
             self.dirty = False
-            # background
-            screen.blit(bg, (0, 0))
-            # objects
+            # rebuild static layer
+            if static is None or static.get_size() != bg.get_size():
+                static = self._static = pg.Surface(bg.get_size()).convert()
+            static.blit(bg, (0, 0))
             for col in self.objs:
                 for objs in col:
                     if objs:
-                        draw_objs(screen, objs)
+                        draw_objs(static, objs)
+            screen.blit(static, (0, 0))
             # moving cars
             self._draw_cars(screen)
             # overlays
@@ -315,29 +373,23 @@ class Level (object):
                 overlay.draw(screen)
             rtn = True
         else:
-            # draw changed tiles
+            # update static layer
+            for tile in self._static_changed:
+                self._draw_static(bg, tile)
+            # draw road: cars move every frame
             rects = self._changed_rects
             in_road_rect = road.tile_rect.collidepoint
-            objs = self.objs
             sx, sy = TILE_SIZE
-            todo_os = set()
-            # draw bg and objs
-            screen.blit(bg, road.rect, road.rect)
-            for x, y in road.tiles:
-                draw_objs(screen, objs[x][y])
-                for overlay in overlays:
-                    if (x, y) in overlay.tiles:
-                        todo_os.add(overlay)
+            screen.blit(static, road.rect, road.rect)
+            todo_os = set(overlay for overlay in overlays
+                          if overlay.rect.colliderect(road.rect))
+            # draw changed tiles
             for tile in self._changed:
                 if in_road_rect(tile):
                     continue
                 x, y = tile
-                this_objs = objs[x][y]
-                x *= sx
-                y *= sy
-                r = (x, y, sx, sy)
-                screen.blit(bg, (x, y), r)
-                draw_objs(screen, this_objs)
+                r = (x * sx, y * sy, sx, sy)
+                screen.blit(static, r, r)
                 # add to changed rects
                 rects.append(r)
                 # add overlays
@@ -352,6 +404,7 @@ class Level (object):
             rtn = rects
         self._changed = set()
         self._changed_rects = []
+        self._static_changed = set()
         return rtn
 
 
@@ -365,6 +418,12 @@ class Level1 (Level):
         game.scheduler.add_timeout(self._step,
                                    seconds = conf.CIRCUIT_MOVE_TIME)
 
+    @classmethod
+    def img_files (cls, ident):
+        fns = Level.img_files(ident)
+        fns.update(circuit.img_files())
+        return fns
+
     def _cleanup (self):
         self._finished = True
 
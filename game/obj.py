@@ -38,6 +38,29 @@ def name (obj):
         return obj.name
     return ident(obj)
 
+def img_files (cls):
+    # return image filenames an object of this class might use, including
+    # objects it might turn into
+    fns = set()
+    todo = [cls]
+    seen = set()
+    while todo:
+        cls = todo.pop()
+        if cls in seen or not isinstance(cls, type) or \
+           not issubclass(cls, OneTileObj):
+            continue
+        seen.add(cls)
+        imgs = list(cls.extra_imgs)
+        if not cls.skip_img:
+            imgs.append(cls.__name__.lower())
+        if hasattr(cls, 'empty_img'):
+            imgs.append(cls.empty_img)
+        fns.update(('obj', img + '.png') for img in imgs)
+        todo += [getattr(cls, 'squash_obj', None),
+                 getattr(cls, 'drop_obj', None)]
+        todo += getattr(cls, 'contents', ())
+    return fns
+
 def article (obj):
     if not isinstance(obj, basestring):
         obj = name(obj)
@@ -71,6 +94,8 @@ class Obj (object):
 
 class OneTileObj (Obj):
     skip_img = False
+    # other images this might use
+    extra_imgs = ()
 
     def __init__ (self, level, pos = None):
         Obj.__init__(self, level, pos)
@@ -320,6 +345,7 @@ class Basket (Container):
 
 class PicnicBlanket (Holdable):
     solid = False
+    extra_imgs = ('oilyblanket',)
     desc = 'A picnic blanket.  I don\'t tend to use those.'
 
     def dirty (self):
@@ -353,6 +379,8 @@ class PuddleOfOil (OneTileObj):
 
 class TrafficLight (OneTileObj):
     skip_img = True
+    extra_imgs = tuple('trafficlight-{0}'.format(state) for state in
+                       xrange(len(conf.CIRCUIT_STATE_COLOURS)))
 
     def __init__ (self, level, *args, **kwargs):
         OneTileObj.__init__(self, level, *args, **kwargs)
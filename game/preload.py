@@ -0,0 +1,94 @@
+from threading import Thread, Condition
+from Queue import Queue
+
+import pygame as pg
+
+
+class Preloader (object):
+    """Decode image files on a worker thread.
+
+    CONSTRUCTOR
+
+Preloader(load = pygame.image.load)
+
+load: function that takes a filename and returns a surface.  This is called on
+      the worker thread, so shouldn't convert the surface for display.
+
+    METHODS
+
+add
+take
+ready
+pending
+
+"""
+
+    def __init__ (self, load = pg.image.load):
+        self._load = load
+        self._queue = Queue()
+        self._pending = set()
+        # {filename: surface}, or None if loading failed
+        self._done = {}
+        self._cond = Condition()
+        self._thread = None
+
+    def _work (self):
+        q = self._queue
+        cond = self._cond
+        while True:
+            fn = q.get()
+            try:
+                sfc = self._load(fn)
+            except (pg.error, IOError):
+                # leave it for the main thread to report
+                sfc = None
+            with cond:
+                self._done[fn] = sfc
+                self._pending.discard(fn)
+                cond.notify_all()
+
+    def add (self, *filenames):
+        """Queue files to be decoded, if not already queued or decoded."""
+        with self._cond:
+            for fn in filenames:
+                if fn not in self._pending and fn not in self._done:
+                    self._pending.add(fn)
+                    self._queue.put(fn)
+        if self._thread is None:
+            self._thread = t = Thread(target = self._work)
+            t.daemon = True
+            t.start()
+
+    def take (self, filename):
+        """Get a decoded surface and forget about it.
+
+If the file is queued, this waits for it to be decoded.  Returns None if the
+file wasn't queued, or failed to load.
+
+"""
+        with self._cond:
+            while filename in self._pending:
+                self._cond.wait()
+            return self._done.pop(filename, None)
+
+    def ready (self, n = None):
+        """Take decoded surfaces that are ready without waiting.
+
+ready([n]) -> surfaces
+
+n: maximum number of surfaces to take; defaults to all of them.
+
+surfaces: a list of (filename, surface) tuples; failed loads are omitted.
+
+"""
+        with self._cond:
+            done = self._done
+            fns = done.keys()
+            if n is not None:
+                fns = fns[:n]
+            surfaces = [(fn, done.pop(fn)) for fn in fns]
+        return [(fn, sfc) for fn, sfc in surfaces if sfc is not None]
+
+    def pending (self):
+        """Get the number of files queued or being decoded."""
+        return len(self._pending)
@@ -0,0 +1,155 @@
+import sys
+import os
+from threading import Thread, current_thread
+from time import sleep
+from timeit import default_timer as time
+from collections import defaultdict
+
+# stack entries for functions that are waiting for the next frame or using
+# spare time, so aren't part of a frame's duration
+IDLE = frozenset(('sched.py:_wait_until', 'sched.py:_run_tasks'))
+
+
+def _stack (frame):
+    # get a root-first tuple of 'file:function' strings
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('{0}:{1}'.format(os.path.basename(code.co_filename),
+                                      code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class SamplingProfiler (object):
+    """Sample a game's main thread stack from another thread.
+
+    CONSTRUCTOR
+
+SamplingProfiler(game, get_id, budget, interval = .001)
+
+game: the Game instance to profile; samples are attributed to its current
+      backend and frame.
+get_id: function that takes a backend and returns its ID.
+budget: function that takes a backend ID and returns the frame time budget for
+        that backend in seconds, or None for no budget.  Samples for frames
+        that take longer than their budget are also kept separately.
+interval: time between samples, in seconds.
+
+A frame's duration is measured here, as the wall-clock time between samples
+while it was current, leaving out samples in IDLE functions.  So it includes
+everything run in the frame, such as scheduled callbacks, whether or not the
+game's frame timer counts it.  Frames are only checked against their budget if
+they're sampled at least once, which shouldn't matter since slow frames will
+be.
+
+    METHODS
+
+start
+stop
+write_collapsed
+write_slow_frames
+
+    ATTRIBUTES
+
+stacks: {(backend_id, stack): count} dict of samples, where stack is a
+        root-first tuple of 'file:function' strings.
+slow_frames: a list of (frame, backend_id, duration, stacks) tuples for frames
+             over budget, where duration is as measured (see above) in seconds
+             and stacks is a list of sampled stacks.
+n_samples: the total number of samples taken.
+
+"""
+
+    def __init__ (self, game, get_id, budget, interval = .001):
+        self.game = game
+        self._get_id = get_id
+        self._budget = budget
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self.slow_frames = []
+        self.n_samples = 0
+        self._ident = current_thread().ident
+        self._stopped = True
+        self._thread = None
+
+    def start (self):
+        """Start sampling the thread this is called from."""
+        self._ident = current_thread().ident
+        self._stopped = False
+        self._thread = t = Thread(target = self._run)
+        t.daemon = True
+        t.start()
+
+    def stop (self):
+        """Stop sampling and wait for the sampling thread to finish."""
+        self._stopped = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _end_frame (self, frame, backend, samples, t):
+        budget = self._budget(backend)
+        if budget is not None and t > budget:
+            self.slow_frames.append((frame, backend, t, samples))
+
+    def _run (self):
+        game = self.game
+        get_id = self._get_id
+        stacks = self.stacks
+        ident = self._ident
+        interval = self.interval
+        # [frame, backend, stacks, duration]
+        current = None
+        t_last = time()
+        while not self._stopped:
+            sleep(interval)
+            frame = sys._current_frames().get(ident)
+            t = time()
+            dt = t - t_last
+            t_last = t
+            if frame is None:
+                continue
+            n = game.frame
+            backend = get_id(game.backend)
+            stack = _stack(frame)
+            del frame
+            stacks[(backend, stack)] += 1
+            self.n_samples += 1
+            if current is None or current[0] != n:
+                if current is not None:
+                    self._end_frame(*current)
+                current = [n, backend, [], 0.]
+            current[2].append(stack)
+            if IDLE.isdisjoint(stack):
+                current[3] += dt
+        if current is not None:
+            self._end_frame(*current)
+
+    def write_collapsed (self, fn):
+        """Write samples in collapsed-stack format for flamegraph tools.
+
+Each line is a semicolon-separated stack, with the backend ID as the root,
+followed by a space and the number of samples.
+
+"""
+        with open(fn, 'w') as f:
+            for (backend, stack), n in sorted(self.stacks.iteritems()):
+                f.write('{0} {1}\n'.format(';'.join((backend,) + stack), n))
+
+    def write_slow_frames (self, fn):
+        """Write samples for frames over budget in collapsed-stack format.
+
+The root of each stack is 'frame <frame> <backend_id> <duration>ms'.
+
+"""
+        with open(fn, 'w') as f:
+            for frame, backend, t, samples in self.slow_frames:
+                root = 'frame {0} {1} {2:.1f}ms'.format(frame, backend,
+                                                        1000 * t)
+                counts = defaultdict(int)
+                for stack in samples:
+                    counts[stack] += 1
+                for stack, n in sorted(counts.iteritems()):
+                    f.write('{0} {1}\n'.format(';'.join((root,) + stack), n))
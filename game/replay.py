@@ -0,0 +1,265 @@
+from struct import Struct
+
+import pygame as pg
+
+from ext.evthandler import pressed_keys
+
+MAGIC = 'latofrec'
+VERSION = 2
+_header = Struct('<8sBII')
+# frame, modifiers, number of events, whether pressed keys follow, number of
+# pressed keys
+_block = Struct('<IHHBH')
+_type = Struct('<H')
+_key = Struct('<i')
+
+
+def _buttons_mask (buttons):
+    mask = 0
+    for i, b in enumerate(buttons):
+        if b:
+            mask |= 1 << i
+    return mask
+
+
+def _mask_buttons (mask):
+    return tuple(int(bool(mask & (1 << i))) for i in xrange(3))
+
+
+# {event type: (payload struct, encode, decode)}, where encode takes an event
+# and returns a tuple to pack, and decode takes the unpacked tuple and returns
+# the event's attributes; other event types are stored without attributes
+_events = {
+    pg.MOUSEMOTION: (
+        Struct('<hhhhB'),
+        lambda e: e.pos + e.rel + (_buttons_mask(e.buttons),),
+        lambda v: {'pos': v[:2], 'rel': v[2:4], 'buttons': _mask_buttons(v[4])}
+    ),
+    pg.KEYDOWN: (
+        Struct('<iH'),
+        lambda e: (e.key, e.mod),
+        lambda v: {'key': v[0], 'mod': v[1], 'unicode': u'', 'scancode': 0}
+    ),
+    pg.KEYUP: (
+        Struct('<iH'),
+        lambda e: (e.key, e.mod),
+        lambda v: {'key': v[0], 'mod': v[1], 'scancode': 0}
+    ),
+    pg.ACTIVEEVENT: (
+        Struct('<BB'),
+        lambda e: (e.gain, e.state),
+        lambda v: {'gain': v[0], 'state': v[1]}
+    ),
+    pg.VIDEORESIZE: (
+        Struct('<HH'),
+        lambda e: e.size,
+        lambda v: {'size': v, 'w': v[0], 'h': v[1]}
+    )
+}
+for t in (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP):
+    _events[t] = (
+        Struct('<hhB'),
+        lambda e: e.pos + (e.button,),
+        lambda v: {'pos': v[:2], 'button': v[2]}
+    )
+
+
+class Recorder (object):
+    """Record input events to a file.
+
+    CONSTRUCTOR
+
+Recorder(fn, seed, level)
+
+fn: the file to write to.
+seed: the seed the random number generator was given before the game started.
+level: the index of the level the game started on.
+
+Pass to Game.set_input before running the game.  Events are taken from
+pygame.event.get and key state from the keyboard, and written in blocks tagged
+with the frame (the number of previous calls to get).
+
+The file is a header, packed from (MAGIC, VERSION, seed, level), then a block
+for each frame with events, changed modifiers or a call to get_pressed.  Each
+block is packed from (frame, modifiers, number of events, whether pressed keys
+were taken, number of pressed keys), followed by each event's type and
+attributes, then the pressed keys.  close writes a final empty block for the
+frame after the last.
+
+    METHODS
+
+get
+get_pressed
+get_mods
+close
+
+    ATTRIBUTES
+
+frame: the number of calls to get so far.
+
+"""
+
+    def __init__ (self, fn, seed, level):
+        self._f = open(fn, 'wb')
+        self._f.write(_header.pack(MAGIC, VERSION, seed, level))
+        self.frame = 0
+        # the last frame's [frame, mods, events, pressed keys or None], not
+        # written until the next frame, since keys may be taken after events
+        self._current = None
+        self._mods = 0
+
+    def _write (self):
+        # write the last frame's block, if there's anything to record
+        if self._current is None:
+            return
+        frame, mods, events, pressed = self._current
+        self._current = None
+        if not events and pressed is None and mods == self._mods:
+            return
+        self._mods = mods
+        pressed = sorted(pressed) if pressed is not None else None
+        data = [_block.pack(frame, mods, len(events), pressed is not None,
+                            len(pressed or ()))]
+        for e in events:
+            data.append(_type.pack(e.type))
+            if e.type in _events:
+                s, encode, decode = _events[e.type]
+                data.append(s.pack(*encode(e)))
+        for k in pressed or ():
+            data.append(_key.pack(k))
+        self._f.write(''.join(data))
+
+    def get (self):
+        """Get and record events, like pygame.event.get."""
+        self._write()
+        events = pg.event.get()
+        mods = pg.key.get_mods() & 0xffff
+        self._current = [self.frame, mods, events, None]
+        self.frame += 1
+        return events
+
+    def get_pressed (self):
+        """Get and record the set of keys held down, from the keyboard."""
+        pressed = pressed_keys()
+        if self._current is not None:
+            self._current[3] = pressed
+        return pressed
+
+    def get_mods (self):
+        """Get the modifiers recorded with the last events, like
+pygame.key.get_mods."""
+        if self._current is None:
+            return pg.key.get_mods()
+        return self._current[1]
+
+    def close (self):
+        """Finish and close the file."""
+        self._write()
+        self._f.write(_block.pack(self.frame, self._mods, 0, False, 0))
+        self._f.close()
+
+
+class Player (object):
+    """Replay input events from a file written by a Recorder.
+
+    CONSTRUCTOR
+
+Player(fn, end = None)
+
+fn: the file to read.
+end: function to call (with no arguments) when get returns the last frame's
+     events.
+
+Pass to Game.set_input in place of pygame.event.get.  To get the same results,
+seed the random number generator with seed and start on level before creating
+the game.  Real events are discarded, apart from pygame.QUIT, and the keyboard
+isn't read: get_pressed and get_mods give the recorded key state, or the keys
+held down according to the replayed key events.
+
+    METHODS
+
+get
+get_pressed
+get_mods
+
+    ATTRIBUTES
+
+end: as given; may be changed.
+seed, level: as given to the Recorder.
+frame: the number of calls to get so far.
+frames: the number of frames recorded.
+done: whether every recorded frame has been returned.
+
+"""
+
+    def __init__ (self, fn, end = None):
+        with open(fn, 'rb') as f:
+            data = f.read()
+        magic, version, self.seed, self.level = _header.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a replay file: \'{0}\''.format(fn))
+        self.end = end
+        # {frame: (mods, events, pressed keys or None)}
+        self._blocks = blocks = {}
+        i = _header.size
+        frame = n = -1
+        while i < len(data):
+            frame, mods, n, has_pressed, n_pressed = \
+                _block.unpack_from(data, i)
+            i += _block.size
+            events = []
+            for j in xrange(n):
+                t = _type.unpack_from(data, i)[0]
+                i += _type.size
+                if t in _events:
+                    s, encode, decode = _events[t]
+                    attrs = decode(s.unpack_from(data, i))
+                    i += s.size
+                else:
+                    attrs = {}
+                events.append(pg.event.Event(t, attrs))
+            pressed = None
+            if has_pressed:
+                pressed = set()
+                for j in xrange(n_pressed):
+                    pressed.add(_key.unpack_from(data, i)[0])
+                    i += _key.size
+            blocks[frame] = (mods, events, pressed)
+        # the last block is empty and for the frame after the last, unless
+        # the recording wasn't closed
+        self.frames = frame if n == 0 else frame + 1
+        self.frame = 0
+        self.done = False
+        self._mods = 0
+        self._pressed = set()
+
+    def get (self):
+        """Get the recorded events for the next frame."""
+        events = []
+        pressed = None
+        if self.frame in self._blocks:
+            self._mods, events, pressed = self._blocks[self.frame]
+        for e in events:
+            if e.type == pg.KEYDOWN:
+                self._pressed.add(e.key)
+            elif e.type == pg.KEYUP:
+                self._pressed.discard(e.key)
+        if pressed is not None:
+            self._pressed = set(pressed)
+        events = events + pg.event.get(pg.QUIT)
+        pg.event.clear()
+        self.frame += 1
+        if not self.done and self.frame >= self.frames:
+            self.done = True
+            if self.end is not None:
+                self.end()
+        return events
+
+    def get_pressed (self):
+        """Get the set of keys held down, as recorded or according to the
+replayed events."""
+        return set(self._pressed)
+
+    def get_mods (self):
+        """Get the modifiers recorded with the last events."""
+        return self._mods
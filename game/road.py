@@ -7,6 +7,15 @@ from util import ir, randsgn, weighted_rand
 from obj import Obj
 
 
+def car_img_files ():
+    fns = []
+    for model, (m_weight, colours) in conf.CAR_WEIGHTINGS.iteritems():
+        for c in colours:
+            for ext in ('', '-crashed'):
+                fns.append(('car', model + '-' + c + ext + '.png'))
+    return fns
+
+
 class Road (object):
     def __init__ (self, level):
         self.level = level
@@ -26,7 +35,8 @@ class Road (object):
             for c, c_weight in colours.iteritems():
                 ws.append(m_weight * c_weight)
                 for ext, dest in (('', imgs), ('-crashed', crashed_imgs)):
-                    img = load_img(('car', model + '-' + c + ext + '.png'))
+                    img = load_img(('car', model + '-' + c + ext + '.png'),
+                                   pin = True)
                     flipped = pg.transform.flip(img, True, False)
                     dest.append((img, flipped))
         # add cars
@@ -244,6 +254,7 @@ class Road (object):
             prev = None
             new_mode = current_mode = 'moving'
             for car in cars:
+                car.last_x = car.rect[0]
                 if lane_mode == 'moving':
                     car.start()
                 if car.mode == 'moving':
@@ -285,6 +296,8 @@ class Car (object):
         self.img = self._img = img
         self._objs = []
         self.rect = pg.Rect(pos, img.get_size())
+        # position at the previous update, for interpolation
+        self.last_x = self.rect[0]
         self.mode = 'moving'
 
     def front (self, dirn):
@@ -337,8 +350,10 @@ class Car (object):
     def destroy (self):
         self._rm_objs()
 
-    def draw (self, screen):
-        screen.blit(self.img, self.rect)
+    def draw (self, screen, interp = 1):
+        x0 = self.last_x
+        x, y = self.rect.topleft
+        screen.blit(self.img, (ir(x0 + interp * (x - x0)), y))
 
 
 class StoppedCar (Obj):
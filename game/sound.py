@@ -0,0 +1,133 @@
+from random import Random
+from timeit import default_timer as time
+
+import pygame as pg
+
+from conf import conf
+
+
+class SoundBank (object):
+    """Decoded sounds and a pool of mixer channels to play them on.
+
+    CONSTRUCTOR
+
+SoundBank(sounds = conf.SOUNDS, preload = conf.PRELOAD_SOUNDS)
+
+sounds: {base_ID: number of sounds} dict, as for conf.SOUNDS.
+preload: whether to load everything now; otherwise, sounds are loaded the first
+         time they're played.
+
+The first conf.SOUND_CHANNELS mixer channels are reserved for this bank.  Each
+base ID can play on at most conf.SOUND_VOICES[base_ID] channels at once; beyond
+that, or if every channel is busy, the sound that has been playing longest is
+cut off to make room.
+
+    METHODS
+
+load
+play
+stats
+
+    ATTRIBUTES
+
+enabled: False if the mixer isn't initialised or conf.SOUND_CHANNELS is 0, in
+         which case nothing is loaded or played.
+
+"""
+
+    def __init__ (self, sounds = conf.SOUNDS, preload = conf.PRELOAD_SOUNDS):
+        self._n_sounds = dict(sounds)
+        # {(base_ID, i): Sound}, with None for invalid sounds
+        self._sounds = {}
+        # {(base_ID, i): (load time, size in bytes)}
+        self._stats = {}
+        # separate from the game's random numbers, so that whether sound is
+        # available doesn't change what happens
+        self._random = Random()
+        n = conf.SOUND_CHANNELS
+        self.enabled = pg.mixer.get_init() is not None and n > 0
+        if not self.enabled:
+            return
+        if pg.mixer.get_num_channels() < n:
+            pg.mixer.set_num_channels(n)
+        pg.mixer.set_reserved(n)
+        self._channels = [pg.mixer.Channel(i) for i in xrange(n)]
+        # [(channel, base_ID)], oldest first
+        self._playing = []
+        if preload:
+            for base_ID, n in self._n_sounds.iteritems():
+                for i in xrange(n):
+                    self.load(base_ID, i)
+
+    def _bytes_per_second (self):
+        freq, fmt, channels = pg.mixer.get_init()
+        return freq * channels * abs(fmt) / 8
+
+    def load (self, base_ID, i):
+        """Load a sound if not already loaded, and return it.
+
+load(base_ID, i) -> sound
+
+sound: the pygame.mixer.Sound, or None if it's invalid.
+
+"""
+        key = (base_ID, i)
+        if key in self._sounds:
+            return self._sounds[key]
+        t0 = time()
+        snd = pg.mixer.Sound(conf.SOUND_DIR + base_ID + str(i) + '.ogg')
+        t = time() - t0
+        length = snd.get_length()
+        if length < 10 ** -3:
+            # no way this is valid
+            snd = None
+        self._sounds[key] = snd
+        self._stats[key] = (t, int(length * self._bytes_per_second()))
+        return snd
+
+    def _channel (self, base_ID):
+        # get a channel to play a sound with the given ID on, or None if it
+        # can't be played at all
+        voices = conf.SOUND_VOICES[base_ID]
+        if voices <= 0:
+            return None
+        playing = [(c, ID) for c, ID in self._playing if c.get_busy()]
+        self._playing = playing
+        same = [c for c, ID in playing if ID == base_ID]
+        if len(same) >= voices:
+            # too many voices: reuse the oldest
+            c = same[0]
+        else:
+            busy = set(c for c, ID in playing)
+            free = [c for c in self._channels if c not in busy]
+            if free:
+                return free[0]
+            # every channel is busy: reuse the oldest
+            c = playing[0][0]
+        c.stop()
+        self._playing = [(o, ID) for o, ID in playing if o is not c]
+        return c
+
+    def play (self, base_ID, volume = 1):
+        """Play a sound, as taken by Game.play_snd."""
+        if not self.enabled:
+            return
+        snd = self.load(base_ID,
+                        self._random.randrange(self._n_sounds[base_ID]))
+        if snd is None:
+            return
+        c = self._channel(base_ID)
+        if c is None:
+            return
+        c.set_volume(volume)
+        c.play(snd)
+        self._playing.append((c, base_ID))
+
+    def stats (self):
+        """Get load statistics for loaded sounds.
+
+Returns a {(base_ID, i): (load_time, size)} dict, with load_time in seconds and
+size the approximate decoded size in bytes.
+
+"""
+        return dict(self._stats)
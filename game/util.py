@@ -1,6 +1,7 @@
 from random import random, randrange
 from collections import defaultdict
 from bisect import bisect
+from threading import Thread
 
 import pygame as pg
 
@@ -31,6 +32,31 @@ def ir (x):
     return (y + (x - y >= .5)) if x > 0 else (y - (y - x >= .5))
 
 
+def in_thread (f, args = (), done = None):
+    """A scheduler task that calls a function on another thread.
+
+in_thread(f, args = (), done = None) -> task
+
+f: the function to call on another thread; it shouldn't use pygame.
+args: arguments to call f with.
+done: a function to call with f's return value on the thread advancing the
+      task, once f returns; not called if f raises an exception.
+
+task: a generator to pass to sched.Scheduler.add_task.  The thread is started
+      the first time it's advanced.
+
+"""
+    result = []
+    t = Thread(target = lambda: result.append(f(*args)))
+    t.daemon = True
+    t.start()
+    while t.is_alive():
+        yield False
+    if result and done is not None:
+        done(result[0])
+    yield True
+
+
 # random
 
 
@@ -125,6 +151,58 @@ blit_flags: the special_flags argument taken by pygame.Surface.blit.
     dest.blit(sfc, p, rect, blit_flags)
 
 
+def merge_rects (rects, clip = None):
+    """Coalesce overlapping and adjacent rects.
+
+merge_rects(rects[, clip]) -> merged
+
+rects: a list of rect-style objects.
+clip: a rect to clip to; empty rects (after clipping) are dropped.
+
+merged: a list of pygame.Rect instances covering at least the area of rects.
+        Rects are only merged if their union covers no more area than they do
+        separately (counting any overlap twice), so this never grows the
+        covered area by much.
+
+"""
+    todo = []
+    for r in rects:
+        r = pg.Rect(r)
+        if clip is not None:
+            r = r.clip(clip)
+        if r.w > 0 and r.h > 0:
+            todo.append(r)
+    done = []
+    while todo:
+        r = todo.pop()
+        area = r.w * r.h
+        for i, o in enumerate(done):
+            u = r.union(o)
+            if u.w * u.h <= area + o.w * o.h:
+                # the union might now merge with others
+                del done[i]
+                todo.append(u)
+                break
+        else:
+            done.append(r)
+    return done
+
+
+def display_depth (headless_depth):
+    """Get the colour depth to pass to pygame.display.set_mode.
+
+display_depth(headless_depth) -> depth
+
+headless_depth: the depth to use with SDL's dummy video driver.
+
+depth: headless_depth with the dummy driver, else 0 (the best available).
+
+"""
+    if pg.display.get_driver() == 'dummy':
+        return headless_depth
+    return 0
+
+
 def convert_sfc (sfc):
     """Convert a surface for blitting."""
     if sfc.get_alpha() is None and sfc.get_colorkey() is None: